@@ -47,11 +47,10 @@ class MonthlyAnalyzer:
         # Initialize all buckets to zero, so we always get the desired months on the graph, even empty. (LP: #623055)
         buckets = dict([(self._DateToBucket(start+relativedelta(months=i)), 0) for i in range(self.Months)]) 
         
-        for t in sorted(transactions):
+        # Every transaction is looked at either way, so there's no need to sort them first.
+        for t in transactions:
             date = t.Date
-            if date >= start:
-                if date > end:
-                    break
+            if start <= date <= end:
                 self._AddToBucket(buckets, date, t.Amount)
             
         return [(key, buckets[key]) for key in sorted(buckets)]
@@ -23,11 +23,13 @@ from wx.lib.pubsub import Publisher
 from wxbanker.bankobjects.ormobject import ORMObject
 from wxbanker.bankobjects.transaction import Transaction
 from wxbanker.bankobjects.recurringtransaction import RecurringTransaction
+from wxbanker.bankobjects.sortedindex import SortedIndex
+from wxbanker.bankobjects.balanceindex import BalanceIndex
 from wxbanker import currencies, bankexceptions, debug
 from wxbanker.mint.api import Mint
 
-from wxbanker.currencies import CurrencyList
-from wxbanker.currconvert import CurrencyConverter
+from wxbanker.currencies import amount2units, units2amount, sumAmounts
+from wxbanker.currconvert import GetConverter
 
 import datetime
 
@@ -43,7 +45,12 @@ class Account(ORMObject):
         self._Name = name
         self._Transactions = None
         self._RecurringTransactions = []
-        self._preTransactions = []
+        # Transactions added before the rest are loaded, by ID, so loading uses these same objects.
+        self._pendingTransactions = {}
+        # SortedIndexes of the transactions by attribute name, built as needed and dropped on any change.
+        self._indexes = {}
+        # The BalanceIndex of the transactions, built as needed and kept up to date.
+        self._balanceIndex = None
         # Make sure that Currency and Balance are not None (bug #653716)
         self.Currency = currency or 0
         self.Balance = balance or 0.0
@@ -51,8 +58,6 @@ class Account(ORMObject):
         self.ShowCurrencyNick = currNick or False
         self.IsFrozen = False
 
-        Publisher.subscribe(self.onTransactionAmountChanged, "ormobject.updated.Transaction.Amount")
-
     def ParseAmount(self, strAmount):
         """
         Robustly parse an amount. Remove ANY spaces, so they can be used as padding
@@ -84,18 +89,21 @@ class Account(ORMObject):
     def SetCurrency(self, currency):
         if type(currency) == int:
             self._Currency = currencies.CurrencyList[currency]()
+            self._CurrencyIndex = currency
         else:
             self._Currency = currency
+            self._CurrencyIndex = currencies.GetCurrencyInt(currency)
 
     def GetCurrency(self):
         return self._Currency
 
+    def GetCurrencyIndex(self):
+        """Return the index of the currency in currencies.CurrencyList."""
+        return self._CurrencyIndex
+
     def balanceAtCurrency(self, balance, currency):
         if currency:
-            conv = CurrencyConverter()
-            destCurrency = CurrencyList[currency]().GetCurrencyNick()
-            srcCurrency = self.GetCurrency().GetCurrencyNick()
-            return conv.Convert(balance, srcCurrency, destCurrency)
+            return GetConverter().ConvertIndex(balance, self.GetCurrencyIndex(), currency)
         return balance
 
     def GetBalance(self, currency=None):
@@ -103,16 +111,21 @@ class Account(ORMObject):
 
     def GetCurrentBalance(self, currency=None):
         """Returns the balance up to and including today, but not transactions in the future."""
-        currentBalance = self.Balance
-        today = datetime.date.today()
-        transactions = self.Transactions[:]
-        transactions.sort()
-        index = len(transactions) - 1
-        while index >= 0 and transactions[index].Date > today:
-            currentBalance -= transactions[index].Amount
-            index -= 1
-
+        if self._Transactions is not None:
+            currentBalance = self.GetBalanceAt(datetime.date.today())
+        else:
+            # Don't load the transactions just for this, the store can sum the future ones.
+            tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+            currentBalance = sumAmounts((self.Balance, -self.Store.GetTransactionSum(self, startDate=tomorrow)))
         return self.balanceAtCurrency(currentBalance, currency)
+
+    def GetBalanceAt(self, date):
+        """Return the balance at the end of the date."""
+        return units2amount(self.GetBalanceIndex().GetBalanceAt(date))
+
+    def GetRunningTotal(self, transaction):
+        """Return the balance just after the transaction, taking them in (Date, ID) order."""
+        return units2amount(self.GetBalanceIndex().GetRunningTotal(transaction))
         
     def GetRecurringTransactions(self):
         return self._RecurringTransactions
@@ -122,23 +135,21 @@ class Account(ORMObject):
 
     def GetTransactions(self):
         if self._Transactions is None:
-            self._Transactions = self.Store.getTransactionsFrom(self)
-            # If transactions were added before this list was pulled,
-            # and then an attribute is changed on one of them (Amount/Description/Date), it won't be
-            # reflected on the new account at run-time because it has a replacement instance for that transaction.
-            # So we need to swap it in.
-            if self._preTransactions:
-                # Iterate over this first (and thus once) since it is probably larger than _pre.
-                for i, newT in enumerate(self._Transactions):
-                    for oldT in self._preTransactions:
-                        # Compare just IDs otherwise TDD is impossible; new attributes not yet stored
-                        # will cause the objects to not be properly replaced and break tests.
-                        if oldT.ID == newT.ID:
-                            self._Transactions[i] = oldT
-                            break
+            self.Store.LoadTransactions([self])
 
         return self._Transactions
 
+    def GetIndex(self, attrname):
+        """Return a SortedIndex of the transactions by the attribute, such as "Date" or "Amount"."""
+        if attrname not in self._indexes:
+            self._indexes[attrname] = SortedIndex(self.Transactions, lambda t: getattr(t, attrname))
+        return self._indexes[attrname]
+
+    def GetBalanceIndex(self):
+        if self._balanceIndex is None:
+            self._balanceIndex = BalanceIndex(self.Transactions)
+        return self._balanceIndex
+
     def GetName(self):
         return self._Name
 
@@ -150,14 +161,65 @@ class Account(ORMObject):
         self.Parent.Remove(self.Name)
 
     def AddTransactions(self, transactions, sources=None):
+        """
+        Enter many transactions at once, such as from an import or a move, optionally
+        as transfers from the corresponding sources. Each account involved gets one
+        INSERT, one balance update, and one transactions.created message.
+        """
+        if not transactions:
+            return
+
         Publisher.sendMessage("batch.start")
         # If we don't have any sources, we want None for each transaction.
         if sources is None:
             sources = [None for i in range(len(transactions))]
-            
-        for t, source in zip(transactions, sources):
-            self.AddTransaction(transaction=t, source=source)
+
+        # They are "partial" because their IDs and parents aren't necessarily correct.
+        for partialTrans in transactions:
+            partialTrans.Parent = self
+
+        # Make the opposite transactions of any transfers first, grouped by source account.
+        sourceAccounts, otherTransactions = [], {}
+        links = []
+        for partialTrans, source in zip(transactions, sources):
+            if source:
+                if source.ID not in otherTransactions:
+                    sourceAccounts.append(source)
+                    otherTransactions[source.ID] = []
+                otherTrans = Transaction(None, source, -1 * partialTrans.Amount, partialTrans._Description, partialTrans.Date)
+                otherTransactions[source.ID].append(otherTrans)
+                links.append((partialTrans, otherTrans))
+
+        for source in sourceAccounts:
+            others = self.Store.MakeTransactions(source, otherTransactions[source.ID])
+            source.addStoredTransactions(others)
+
+        # Our side doesn't have an ID yet, so this link is just stored along with it.
+        for partialTrans, otherTrans in links:
+            partialTrans.LinkedTransaction = otherTrans
+        self.Store.MakeTransactions(self, transactions)
+        for partialTrans, otherTrans in links:
+            otherTrans.LinkedTransaction = partialTrans
+
+        self.addStoredTransactions(transactions)
         Publisher.sendMessage("batch.end")
+
+    def addStoredTransactions(self, transactions):
+        """Put newly stored transactions in this account, updating the balance once."""
+        # Don't extend if there aren't transactions loaded yet, they are already in the model and will appear on a load. (LP: 347385).
+        if self._Transactions is not None:
+            self._Transactions.extend(transactions)
+            self._indexes.clear()
+            if self._balanceIndex is not None:
+                for transaction in transactions:
+                    self._balanceIndex.Add(transaction)
+        else:
+            # Remember them so the load uses these objects instead of making new ones.
+            for transaction in transactions:
+                self._pendingTransactions[transaction.ID] = transaction
+
+        Publisher.sendMessage("transactions.created", (self, transactions))
+        self.Balance = sumAmounts([self.Balance] + [t.Amount for t in transactions])
         
     def AddRecurringTransaction(self, amount, description, date, repeatType, repeatEvery=1, repeatOn=None, endDate=None, source=None):
         # Create the recurring transaction object.
@@ -212,14 +274,17 @@ class Account(ORMObject):
         # Don't append if there aren't transactions loaded yet, it is already in the model and will appear on a load. (LP: 347385).
         if self._Transactions is not None:
             self.Transactions.append(transaction)
+            self._indexes.clear()
+            if self._balanceIndex is not None:
+                self._balanceIndex.Add(transaction)
         else:
-            # We will need to do some magic with these later when transactions are loaded.
-            self._preTransactions.append(transaction)
+            # Remember it so the load uses this object instead of making a new one.
+            self._pendingTransactions[transaction.ID] = transaction
 
         Publisher.sendMessage("transaction.created", (self, transaction))
 
         # Update the balance.
-        self.Balance += transaction.Amount
+        self.Balance = sumAmounts((self.Balance, transaction.Amount))
         Publisher.sendMessage("batch.end")
 
         if source:
@@ -246,31 +311,56 @@ class Account(ORMObject):
         # Make a copy of the list, to protect against getting passed self.Transactions itself.
         # Otherwise when we remove from self.Transactions, we'd end up iterating over every other transaction! (LP: #605591)
         transactions = transactions[:]
-        
+
+        # Check membership by ID, as comparing against every transaction makes large removals quadratic.
+        remainingIds = set(t.ID for t in self.Transactions)
+        links = []
         for transaction in transactions:
-            if transaction not in self.Transactions:
+            if transaction.ID not in remainingIds:
                 raise bankexceptions.InvalidTransactionException("Transaction does not exist in account '%s'" % self.Name)
+            remainingIds.remove(transaction.ID)
 
-            # If this transaction was a transfer, delete the other transaction as well.
-            if transaction.LinkedTransaction:
-                link = transaction.LinkedTransaction
+            # If this transaction was a transfer, the other transaction needs handling as well.
+            link = transaction.LinkedTransaction
+            if link:
                 sources.append(link.Parent)
-                # Kill the other transaction's link to this one, otherwise this is quite recursive.
-                link.LinkedTransaction = None
-                # Delete the linked transaction from its account as well, if we should.
-                if removeLinkedTransactions:
-                    link.Remove()
+                links.append(link)
             else:
                 sources.append(None)
 
-            # Now remove this transaction.
-            self.Store.RemoveTransaction(transaction)
+        if links:
+            # Kill the other transactions' links to these, otherwise this is quite recursive.
+            # This is done quietly, as they are either about to be deleted or unlinked together below.
+            for link in links:
+                link.IsFrozen = True
+                link.LinkedTransaction = None
+                link.IsFrozen = False
+
+            # Delete the linked transactions from their accounts as well, if we should.
+            if removeLinkedTransactions:
+                linkAccounts, linksByAccount = [], {}
+                for link in links:
+                    if link.Parent.ID not in linksByAccount:
+                        linkAccounts.append(link.Parent)
+                        linksByAccount[link.Parent.ID] = []
+                    linksByAccount[link.Parent.ID].append(link)
+                for linkAccount in linkAccounts:
+                    linkAccount.RemoveTransactions(linksByAccount[linkAccount.ID])
+            else:
+                self.Store.UnlinkTransactions(links)
+
+        # Now remove these transactions.
+        self.Store.RemoveTransactions(transactions)
+        for transaction in transactions:
             transaction.Parent = None
-            self.Transactions.remove(transaction)
-            difference += transaction.Amount
+            difference += amount2units(transaction.Amount)
+            if self._balanceIndex is not None:
+                self._balanceIndex.Remove(transaction)
+        self._Transactions[:] = [t for t in self._Transactions if t.ID in remainingIds]
+        self._indexes.clear()
 
         # Update the balance.
-        self.Balance -= difference
+        self.Balance = units2amount(amount2units(self.Balance) - difference)
         # Send the message for all transactions at once, cuts _97%_ of time! OLV is slow here I guess.
         Publisher.sendMessage("transactions.removed", (self, transactions))
         Publisher.sendMessage("batch.end")
@@ -320,7 +410,7 @@ class Account(ORMObject):
         except:
             return False
         
-        inSync = abs(mintBalance - self.CurrentBalance) < .001
+        inSync = amount2units(mintBalance) == amount2units(self.CurrentBalance)
         return inSync
     
     def GetSyncString(self):
@@ -336,13 +426,28 @@ class Account(ORMObject):
         
         return syncString
 
-    def onTransactionAmountChanged(self, message):
-        transaction = message.data
-        if transaction.Parent == self:
-            debug.debug("Updating balance because I am %s: %s" % (self.Name, transaction))
-            self.Balance = sum((t.Amount for t in self.Transactions))
-        else:
-            debug.debug("Ignoring transaction because I am %s: %s" % (self.Name, transaction))
+    def onTransactionAmountChanged(self, transaction):
+        """Adjust the balance by the change in the amount of one of our transactions, from the AccountList."""
+        debug.debug("Updating balance because I am %s: %s" % (self.Name, transaction))
+        difference = amount2units(transaction.Amount) - amount2units(transaction.PreviousAmount or 0)
+        self.Balance = units2amount(amount2units(self.Balance) + difference)
+        self._indexes.pop("Amount", None)
+        if self._balanceIndex is not None:
+            self._balanceIndex.Update(transaction)
+
+    def onTransactionDateChanged(self, transaction):
+        """Update the order and indexes for the new date of one of our transactions, from the AccountList."""
+        if self._Transactions is not None:
+            self._Transactions.Reposition(transaction, transaction.PreviousDate)
+        self._indexes.pop("Date", None)
+        if self._balanceIndex is not None:
+            self._balanceIndex.Update(transaction)
+
+    def getAttrValue(self, attrname):
+        # The balance is stored as integer units, like transaction amounts.
+        if attrname == "Balance":
+            return amount2units(self.Balance)
+        return ORMObject.getAttrValue(self, attrname)
 
     def float2str(self, *args, **kwargs):
         return self.Currency.float2str(withNick=self.ShowCurrencyNick, *args, **kwargs)
@@ -25,15 +25,20 @@ from wxbanker import bankexceptions
 class AccountList(list):
     def __init__(self, bankmodel, store):
         list.__init__(self, store.GetAccounts())
+        # The accounts by ID, for GetById and to pass transaction changes straight to the owner.
+        self.dispatchTable = {}
         # Make sure all the items know their parent list.
         for account in self:
             account.Parent = self
+            self.dispatchTable[account.ID] = account
 
         self.BankModel = bankmodel
         self.Store = store
         self.sort()
         
         Publisher.subscribe(self.onAccountRenamed, "ormobject.updated.Account.Name")
+        Publisher.subscribe(self.onTransactionAmountChanged, "ormobject.updated.Transaction.Amount")
+        Publisher.subscribe(self.onTransactionDateChanged, "ormobject.updated.Transaction.Date")
         
     def GetRecurringTransactions(self):
         allRecurrings = []
@@ -52,9 +57,7 @@ class AccountList(list):
         return total
     
     def GetById(self, theId):
-        for account in self:
-            if account.ID == theId:
-                return account
+        return self.dispatchTable.get(theId)
 
     def AccountIndex(self, accountName):
         for i, account in enumerate(self):
@@ -81,6 +84,7 @@ class AccountList(list):
         account = self.Store.CreateAccount(accountName, currency)
         # Make sure this account knows its parent.
         account.Parent = self
+        self.dispatchTable[account.ID] = account
         self.append(account)
         self.sort()
         Publisher.sendMessage("account.created.%s" % accountName, account)
@@ -92,6 +96,7 @@ class AccountList(list):
             raise bankexceptions.InvalidAccountException(accountName)
 
         account = self.pop(index)
+        del self.dispatchTable[account.ID]
         # Remove all the transactions associated with this account.
         account.Purge()
         
@@ -109,5 +114,25 @@ class AccountList(list):
     def onAccountRenamed(self, message):
         self.sort()
 
+    def IsOwnAccount(self, account):
+        """Return whether the account is in this list, rather than another model's."""
+        return self.dispatchTable.get(account.ID) is account
+
+    def getOwner(self, transaction):
+        """Return the account in this list owning the transaction, if any."""
+        parent = transaction.Parent
+        if parent is not None and self.dispatchTable.get(parent.ID) is parent:
+            return parent
+
+    def onTransactionAmountChanged(self, message):
+        account = self.getOwner(message.data)
+        if account is not None:
+            account.onTransactionAmountChanged(message.data)
+
+    def onTransactionDateChanged(self, message):
+        account = self.getOwner(message.data)
+        if account is not None:
+            account.onTransactionDateChanged(message.data)
+
     Balance = property(GetBalance)
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+#    https://launchpad.net/wxbanker
+#    balanceindex.py: Copyright 2007-2010 Mike Rooney <mrooney@ubuntu.com>
+#
+#    This file is part of wxBanker.
+#
+#    wxBanker is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    wxBanker is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with wxBanker.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+from wxbanker.currencies import amount2units
+
+class BalanceIndex(object):
+    """
+    Running balances of an account's transactions, in integer units. The amounts on each
+    day are summed in a Fenwick tree over day ordinals, so adding, removing or changing a
+    transaction and the balance at a date or after a transaction are all O(log days).
+    Within a day, transactions count in order of ID, as they are sorted by (Date, ID).
+    """
+    def __init__(self, transactions):
+        # The (ordinal, units) of each transaction by ID, and the units of each day by ID.
+        self.Entries = {}
+        self.Days = {}
+        for transaction in transactions:
+            ordinal, units = transaction.Date.toordinal(), amount2units(transaction.Amount)
+            self.Entries[transaction.ID] = (ordinal, units)
+            self.Days.setdefault(ordinal, {})[transaction.ID] = units
+
+        today = datetime.date.today().toordinal()
+        self.build(min(self.Days or [today]), max(self.Days or [today]))
+
+    def build(self, first, last):
+        """Build the tree for days from first to last with room to spare either side, in O(days)."""
+        slack = max(366, (last - first) // 2)
+        self.First = first - slack
+        self.Size = last - first + 2 * slack + 1
+
+        tree = [0] * (self.Size + 1)
+        for ordinal, day in self.Days.iteritems():
+            tree[ordinal - self.First + 1] += sum(day.itervalues())
+        for i in xrange(1, self.Size + 1):
+            parent = i + (i & -i)
+            if parent <= self.Size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def addUnits(self, ordinal, units):
+        i = ordinal - self.First + 1
+        if not 0 < i <= self.Size:
+            # The day is out of range, so make room for it; Days already has it.
+            self.build(min(self.Days), max(self.Days))
+            return
+        while i <= self.Size:
+            self.tree[i] += units
+            i += i & -i
+
+    def prefix(self, ordinal):
+        """Return the units on all days up to and including ordinal."""
+        i = min(ordinal - self.First + 1, self.Size)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def Add(self, transaction):
+        ordinal, units = transaction.Date.toordinal(), amount2units(transaction.Amount)
+        self.Entries[transaction.ID] = (ordinal, units)
+        self.Days.setdefault(ordinal, {})[transaction.ID] = units
+        self.addUnits(ordinal, units)
+
+    def Remove(self, transaction):
+        ordinal, units = self.Entries.pop(transaction.ID)
+        day = self.Days[ordinal]
+        del day[transaction.ID]
+        if not day:
+            del self.Days[ordinal]
+        self.addUnits(ordinal, -units)
+
+    def Update(self, transaction):
+        """Apply a change to the amount or date of a transaction."""
+        self.Remove(transaction)
+        self.Add(transaction)
+
+    def GetBalanceAt(self, date):
+        """Return the balance in units at the end of the date."""
+        return self.prefix(date.toordinal())
+
+    def GetRunningTotal(self, transaction):
+        """Return the balance in units just after the transaction."""
+        ordinal = self.Entries[transaction.ID][0]
+        sameDay = sum(units for tID, units in self.Days[ordinal].iteritems() if tID <= transaction.ID)
+        return self.prefix(ordinal - 1) + sameDay
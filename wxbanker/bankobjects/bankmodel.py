@@ -21,14 +21,29 @@
 import wx
 from wx.lib.pubsub import Publisher
 import wx.lib.delayedresult as delayedresult
-import re, datetime
+import re, datetime, calendar, heapq, string, unicodedata
 
 from wxbanker import currencies
 from wxbanker.bankobjects.ormobject import ORMKeyValueObject
 from wxbanker.bankobjects.accountlist import AccountList
+from wxbanker.bankobjects.tag import Tag
+from wxbanker.bankobjects.transactionlist import sortKey
 from wxbanker.mint.api import Mint
+from wxbanker.currconvert import GetConverter
 
-from wxbanker.currencies import GetCurrencyInt
+from wxbanker.currencies import GetCurrencyInt, amount2units, units2amount
+
+# Lowers only ASCII letters, as SQLite's LIKE does when comparing.
+ASCII_LOWER = dict((ord(c), ord(c.lower())) for c in string.ascii_uppercase)
+
+def foldText(text):
+    """Return text without accents, roughly as the full-text index sees it."""
+    try:
+        text.encode("ascii")
+        return text
+    except UnicodeError:
+        text = unicodedata.normalize("NFKD", unicode(text))
+        return u"".join(c for c in text if not unicodedata.combining(c))
 
 class BankModel(ORMKeyValueObject):
     ORM_TABLE = "meta"
@@ -38,7 +53,10 @@ class BankModel(ORMKeyValueObject):
         ORMKeyValueObject.__init__(self, store)
         self.Store = store
         self.Accounts = AccountList(self, store)
-        self._Tags = {}
+        # The merged transactions of every account, see GetTransactions.
+        self.transactionsSnapshot = None
+        # The transactions with objects by ID, kept up to date for resolving links while loading and for searches.
+        self.transactionsById = {}
 
         # Handle Mint integration, but send the message in the main thread, otherwise, dead.
         if self.MintEnabled:
@@ -48,8 +66,12 @@ class BankModel(ORMKeyValueObject):
         Publisher.subscribe(self.onAccountCurrencyChanged, "user.account_currency_changed")
         Publisher.subscribe(self.onMintToggled, "user.mint.toggled")
         Publisher.subscribe(self.onAccountChanged, "view.account changed")
-        Publisher.subscribe(self.onTransactionTagged, "transaction.tagged")
-        Publisher.subscribe(self.onTransactionUntagged, "transaction.untagged")
+        for topic in ("transaction.created", "transactions.created", "transactions.removed", "ormobject.updated.Transaction.Date", "account.created", "account.removed"):
+            Publisher.subscribe(self.onTransactionsChanged, topic)
+        Publisher.subscribe(self.onTransactionsLoaded, "transactions.loaded")
+        Publisher.subscribe(self.onTransactionCreated, "transaction.created")
+        Publisher.subscribe(self.onTransactionsCreated, "transactions.created")
+        Publisher.subscribe(self.onTransactionsRemoved, "transactions.removed")
         
     def GetLastAccount(self):
         return self.Accounts.GetById(self.LastAccountId)
@@ -60,48 +82,171 @@ class BankModel(ORMKeyValueObject):
     def GetRecurringTransactions(self):
         return self.Accounts.GetRecurringTransactions()
 
+    def IterTransactions(self):
+        """
+        Iterate over the transactions of every account in (Date, ID) order, merging
+        the already sorted lists of each account rather than sorting them all.
+        """
+        self.loadTransactions()
+        # Compare keys rather than the transactions, so the heap does its comparisons in C.
+        decorated = [((t._Date, t.ID, t) for t in account.Transactions) for account in self.Accounts]
+        for date, tID, transaction in heapq.merge(*decorated):
+            yield transaction
+
     def GetTransactions(self):
-        transactions = []
-        for account in self.Accounts:
-            transactions.extend(account.Transactions)
+        """
+        Return the transactions of every account in (Date, ID) order. This is a snapshot
+        kept until transactions are added, removed or redated, so don't modify it.
+        """
+        if self.transactionsSnapshot is None:
+            self.transactionsSnapshot = list(self.IterTransactions())
+        return self.transactionsSnapshot
 
+    def onTransactionsChanged(self, message):
+        self.transactionsSnapshot = None
+
+    def loadTransactions(self):
+        """Make sure the transactions of every account are loaded, and so in transactionsById."""
+        unloaded = [account for account in self.Accounts if account._Transactions is None]
+        if unloaded:
+            # Load them together, in one pass rather than one per account.
+            self.Store.LoadTransactions(unloaded)
+
+    def GetTransactionById(self, tId):
+        """Return the transaction with the ID, or None if there isn't one."""
+        self.loadTransactions()
+        return self.transactionsById.get(tId)
+
+    def getTransactionsWithIds(self, ids, account=None):
+        """Return the loaded transactions (of the account, if given) with the IDs, sorted."""
+        transactions = []
+        for tId in ids:
+            transaction = self.transactionsById.get(tId)
+            if transaction is not None and (account is None or transaction.Parent is account):
+                transactions.append(transaction)
+        transactions.sort(key=sortKey)
         return transactions
+
+    def indexTransactions(self, account, transactions):
+        if self.Accounts.IsOwnAccount(account):
+            for transaction in transactions:
+                self.transactionsById[transaction.ID] = transaction
+
+    def onTransactionsLoaded(self, message):
+        accounts, tagCounts = message.data
+        for account in accounts:
+            self.indexTransactions(account, account.Transactions)
+
+    def onTransactionCreated(self, message):
+        account, transaction = message.data
+        self.indexTransactions(account, [transaction])
+
+    def onTransactionsCreated(self, message):
+        account, transactions = message.data
+        self.indexTransactions(account, transactions)
+
+    def onTransactionsRemoved(self, message):
+        # A removed account isn't in the list anymore, so just check they are the indexed objects.
+        account, transactions = message.data
+        for transaction in transactions:
+            if self.transactionsById.get(transaction.ID) is transaction:
+                del self.transactionsById[transaction.ID]
     
     def GetDateRange(self):
         """Get the date of the first and last transaction."""
-        transactions = self.GetTransactions()
-        
+        # Each account's transactions are sorted, so only the ends of each matter.
+        ends = []
+        for account in self.Accounts:
+            if account.Transactions:
+                ends.extend((account.Transactions[0].Date, account.Transactions[-1].Date))
+
         # If there are no transactions, let's go with today.
-        if not transactions:
+        if not ends:
             return datetime.date.today(), datetime.date.today()
         else:
-            # Sorting transactions is very important, otherwise the first and last dates are arbitrary!
-            transactions.sort()
-            return transactions[0].Date, transactions[-1].Date
+            return min(ends), max(ends)
 
     def GetXTotals(self, account=None, daterange=None):
         """
         Get totals every so many days, optionally within a specific account
         and/or date range. This is particularly useful when we want to
         graph a summary of account balances.
+
+        With NumPy, the balance on each day is looked up in the cumulative sum of the
+        amounts instead of walking the transactions a day at a time. It is only imported
+        here, as for the plots, so loading the model doesn't pay for it.
         """
         if account is None:
-            transactions = self.GetTransactions()
+            accounts = list(self.Accounts)
             currency = self.GlobalCurrency
         else:
-            transactions = account.Transactions[:]
+            accounts = [account]
             currency = GetCurrencyInt(account.GetCurrency())
-        transactions.sort()
+
+        try:
+            return self.getXTotalsVectorized(accounts, currency, daterange)
+        except ImportError:
+            # NumPy is optional.
+            return self.getXTotalsByDay(accounts, currency, daterange)
+
+    def getXTotalsVectorized(self, accounts, currency, daterange):
+        import numpy
+        ordinals, units = [], []
+        for account in accounts:
+            transactions = account.Transactions
+            count = len(transactions)
+            ordinals.append(numpy.fromiter((t.Date.toordinal() for t in transactions), numpy.int64, count))
+            amounts = numpy.fromiter((t.Amount for t in transactions), numpy.float64, count)
+            # Convert a whole account at once, as Transaction.GetAmount would each amount.
+            if currency and account.GetCurrencyIndex() != currency:
+                amounts = amounts * GetConverter().GetRate(account.GetCurrencyIndex(), currency)
+            units.append(self.amounts2units(amounts))
+
+        ordinals = numpy.concatenate(ordinals) if ordinals else numpy.zeros(0, numpy.int64)
+        if not len(ordinals):
+            return []
+        units = numpy.concatenate(units)
+        order = numpy.argsort(ordinals, kind="mergesort")
+        ordinals, balances = ordinals[order], numpy.cumsum(units[order])
+
+        if daterange:
+            startDate, endDate = daterange
+        else:
+            # If the last transaction was before today, we still want to graph until today.
+            startDate = datetime.date.fromordinal(int(ordinals[0]))
+            endDate = max(datetime.date.fromordinal(int(ordinals[-1])), datetime.date.today())
+
+        # The balance on each day is the sum of every amount up to and including it.
+        days = numpy.arange(startDate.toordinal(), endDate.toordinal() + 1)
+        counts = numpy.searchsorted(ordinals, days, side="right")
+        dayBalances = numpy.where(counts > 0, balances[counts - 1], 0) / float(currencies.AMOUNT_SCALE)
+        return [[datetime.date.fromordinal(day), balance] for day, balance in zip(days.tolist(), dayBalances.tolist())]
+
+    def amounts2units(self, amounts):
+        """Like currencies.amount2units for an array, rounding halves away from zero as round() does."""
+        import numpy
+        scaled = amounts * currencies.AMOUNT_SCALE
+        whole = numpy.trunc(scaled)
+        whole += numpy.where(numpy.abs(scaled - whole) >= .5, numpy.sign(scaled), 0)
+        return whole.astype(numpy.int64)
+
+    def getXTotalsByDay(self, accounts, currency, daterange):
+        # One account's transactions, or all of them merged, are already sorted.
+        if len(accounts) == 1:
+            transactions = accounts[0].Transactions
+        else:
+            transactions = self.GetTransactions()
         
         if transactions == []:
             return []
         
-        startingBalance = 0.0
+        # Balances are summed in integer units so they are exact, see currencies.AMOUNT_DIGITS.
+        startingBalance = 0
         # Crop transactions around the date range, if supplied.
         if daterange:
             startDate, endDate = daterange
             starti, endi = None, len(transactions)
-            total = 0.0
+            total = 0
             for i, t in enumerate(transactions):
                 if starti is None and t.Date >= startDate:
                     starti = i
@@ -109,7 +254,7 @@ class BankModel(ORMKeyValueObject):
                 if t.Date > endDate:
                     endi = i
                     break
-                total += t.GetAmount(currency)
+                total += amount2units(t.GetAmount(currency))
                 
             transactions = transactions[starti:endi]
         else:
@@ -131,9 +276,9 @@ class BankModel(ORMKeyValueObject):
         balance = startingBalance
         while currDate <= endDate:
             while tindex < len(transactions) and transactions[tindex].Date <= currDate:
-                balance += transactions[tindex].GetAmount(currency)
+                balance += amount2units(transactions[tindex].GetAmount(currency))
                 tindex += 1
-            totals.append([currDate, balance])
+            totals.append([currDate, units2amount(balance)])
             currDate += onedaydelta
 
         return totals
@@ -144,12 +289,46 @@ class BankModel(ORMKeyValueObject):
     def RemoveAccount(self, accountName):
         return self.Accounts.Remove(accountName)
 
-    def Search(self, searchString, account=None, matchIndex=1):
+    def Search(self, searchString, account=None, matchIndex=1, regex=False):
         """
         matchIndex: 0: Amount, 1: Description, 2: Date
         I originally used strings here but passing around and then validating on translated
         strings seems like a bad and fragile idea.
+
+        Description searches for plain words match descriptions with each of them, see
+        GetWordsPredicate, using the store's full-text index. Amount and date searches
+        may be ranges such as "100..500", "2010-03" or "2010-03-15..2010-04", see Query.
+        Other searches, or any with regex set, match searchString as a regular expression.
         """
+        kind = self.GetSearchKind(searchString, matchIndex, regex)
+
+        # Amount and date ranges can be answered from sorted indexes.
+        if kind == "range":
+            accounts = self.Accounts
+            if account is not None:
+                accounts = [account]
+            bounds = self.parseRange(searchString, matchIndex)
+            if matchIndex == 0:
+                return self.Query(accounts, amountRange=bounds)
+            return self.Query(accounts, dateRange=bounds)
+
+        # A description search for a single tag can use the tag index instead of every description,
+        # and the matching IDs are looked up rather than checking every transaction.
+        if kind in ("tag", "words"):
+            if account is None:
+                self.loadTransactions()
+            else:
+                account.Transactions
+            if kind == "tag":
+                # Match tags starting with it, so a partly typed tag finds the whole ones.
+                ids = self.Store.GetTransactionIdsWithTagPrefix(searchString[1:].lower())
+                return self.getTransactionsWithIds(ids, account)
+
+            # The store only knows the descriptions as entered, but transfers show their accounts too, so check them here.
+            ids = self.Store.SearchDescriptions(self.getSearchWords(searchString)) | self.Store.GetLinkedTransactionIds()
+            predicate = self.GetWordsPredicate(searchString)
+            return [trans for trans in self.getTransactionsWithIds(ids, account) if predicate(trans)]
+
         # Handle account options.
         if account is None:
             potentials = self.GetTransactions()
@@ -157,13 +336,146 @@ class BankModel(ORMKeyValueObject):
             potentials = account.Transactions[:]
 
         # Find all the matches.
+        pattern = re.compile(searchString, flags=re.IGNORECASE)
+        return [trans for trans in potentials if self.patternMatches(pattern, trans, matchIndex)]
+
+    def GetSearchKind(self, searchString, matchIndex=1, regex=False):
+        """
+        Return how Search answers a search: "range" for an amount or date range,
+        "tag" for a single #tag or the start of one, "words" for plain words in the full-text index,
+        "literal" for a pattern with no special characters and otherwise "regex".
+        """
+        if matchIndex in (0, 2) and not regex and self.parseRange(searchString, matchIndex) is not None:
+            return "range"
+        if matchIndex == 1 and not regex and re.match(r"^#[^\s#]+$", searchString):
+            return "tag"
+
+        # Anything that looks like a regular expression is treated as one, as is everything without the index.
+        if re.search(r"[.^$*+?{}\[\]\\|()]", searchString):
+            return "regex"
+        if matchIndex == 1 and not regex and self.Store.FullTextSearch and self.getSearchWords(searchString):
+            return "words"
+        return "literal"
+
+    def getSearchWords(self, searchString):
+        return re.findall(r"\w+", searchString, flags=re.UNICODE)
+
+    def GetWordsPredicate(self, searchString):
+        """
+        Return whether a transaction matches a search for words, by its description as shown.
+        Each word must either be in it, ignoring ASCII case, or start one of its words ignoring
+        case and accents, just as the store's SearchDescriptions finds them.
+        """
+        words = [unicode(word) for word in self.getSearchWords(searchString)]
+        substrings = [word.translate(ASCII_LOWER) for word in words]
+        # Letters and digits make up the words of the full-text index, so "_" separates them too.
+        starts = [re.compile(r"(?<![^\W_])" + re.escape(foldText(word)), flags=re.IGNORECASE|re.UNICODE) for word in words]
+
+        def predicate(trans):
+            description = unicode(trans.Description)
+            lowered, folded = description.translate(ASCII_LOWER), None
+            for substring, start in zip(substrings, starts):
+                if substring in lowered:
+                    continue
+                if folded is None:
+                    folded = foldText(description)
+                if not start.search(folded):
+                    return False
+            return True
+        return predicate
+
+    def patternMatches(self, pattern, trans, matchIndex):
+        return pattern.search(unicode((trans.Amount, trans.Description, trans.Date)[matchIndex])) is not None
+
+    def Query(self, accounts=None, amountRange=None, dateRange=None, tags=None):
+        """
+        Return the transactions, sorted, in the accounts (default all of them) with an amount
+        and date within the (low, high) ranges and all of the tags, where any criterion or bound
+        may be None. Ranges are inclusive and answered by bisecting each account's SortedIndexes.
+        """
+        if accounts is None:
+            accounts = self.Accounts
+
         matches = []
-        for trans in potentials:
-            potentialStr = unicode((trans.Amount, trans.Description, trans.Date)[matchIndex])
-            if re.findall(searchString, potentialStr, flags=re.IGNORECASE):
-                matches.append(trans)
+        for account in accounts:
+            candidates = []
+            if dateRange is not None:
+                candidates.append(account.GetIndex("Date").Between(*dateRange))
+            if amountRange is not None:
+                candidates.append(account.GetIndex("Amount").Between(*amountRange))
+            if not candidates:
+                candidates.append(account.Transactions)
+
+            # Filter the smallest result by the others.
+            candidates.sort(key=len)
+            for other in candidates[1:]:
+                ids = set(t.ID for t in other)
+                candidates[0] = [t for t in candidates[0] if t.ID in ids]
+            matches.extend(candidates[0])
+
+        if tags:
+            for tag in tags:
+                ids = self.Store.GetTransactionIdsWithTag(tag)
+                matches = [t for t in matches if t.ID in ids]
+
+        matches.sort(key=sortKey)
         return matches
 
+    def parseRange(self, searchString, matchIndex):
+        """
+        Parse an amount (matchIndex 0) or date (matchIndex 2) range for Query,
+        returning None if searchString isn't one.
+        Amounts need "..", as in "100..500", "..-20" or "1000..". Dates can also be a single
+        year, month or day, like "2010", "2010-03" or "2010/03/15", meaning that whole period.
+        """
+        searchString = searchString.strip()
+        try:
+            if ".." in searchString:
+                low, high = searchString.split("..", 1)
+                return self.ParseBounds(low, high, matchIndex)
+            elif matchIndex == 2:
+                return self.parseDatePeriod(searchString)
+        except ValueError:
+            pass
+
+    def ParseBounds(self, low, high, matchIndex):
+        """
+        Return the (low, high) amount (matchIndex 0) or date (matchIndex 2) range for Query
+        from the text of each bound, either of which may be blank for an open end.
+        Raise a ValueError if a bound isn't an amount or a date period.
+        """
+        if matchIndex == 0:
+            parse = float
+        else:
+            parse = self.parseDatePeriod
+        bounds = [None, None]
+        low, high = low.strip(), high.strip()
+        if low:
+            bounds[0] = parse(low)
+        if high:
+            bounds[1] = parse(high)
+        if matchIndex == 2:
+            # A period as a bound extends from its first day or to its last.
+            bounds = [bounds[0] and bounds[0][0], bounds[1] and bounds[1][1]]
+        return tuple(bounds)
+
+    def parseDatePeriod(self, text):
+        """Return the first and last dates in a "YYYY", "YYYY-MM" or "YYYY-MM-DD" period, or raise a ValueError."""
+        # Partial months and days, as when typing "2010-03-1", aren't periods.
+        match = re.match(r"^(\d{4})(?:[-/](\d{2})(?:[-/](\d{2}))?)?$", text)
+        if match is None:
+            raise ValueError("Not a date period: %s" % text)
+
+        year, month, day = match.groups()
+        year = int(year)
+        if month is None:
+            return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+        month = int(month)
+        if day is None:
+            return datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])
+        day = datetime.date(year, month, int(day))
+        return day, day
+
     def Save(self):
         self.Store.Save()
 
@@ -199,21 +511,6 @@ class BankModel(ORMKeyValueObject):
         else:
             self.LastAccountId = None
             
-    def onTransactionTagged(self, message):
-        tagNames = message.data
-        for tag in tagNames:
-            if tag in self._Tags:
-                self._Tags[tag] += 1
-            else:
-                self._Tags[tag] = 1
-                
-    def onTransactionUntagged(self, message):
-        tagNames = message.data
-        for tag in tagNames:
-            self._Tags[tag] -= 1
-            if self._Tags[tag] == 0:
-                self._Tags.pop(tag)
-                
     def onMintToggled(self, message):
         enabled = message.data
         self.MintEnabled = enabled
@@ -233,7 +530,8 @@ class BankModel(ORMKeyValueObject):
                 print t
                 
     def GetTags(self):
-        return set(self._Tags.keys())
+        # These come from the store's tag index, so they include transactions not loaded yet.
+        return set(Tag(name) for name in self.Store.GetTagCounts())
 
     Balance = property(GetBalance)
     Tags = property(GetTags)
@@ -20,26 +20,90 @@
 
 from wx.lib.pubsub import Publisher
 
+class ORMField(object):
+    """
+    A persisted attribute. Setting it marks the field dirty on its object, for the
+    store to write along with any other changes, and tells listeners of the change.
+    It wraps whatever the class had for the attribute (a property or a slot), or
+    otherwise keeps the value in the object's __dict__.
+    """
+    def __init__(self, name, inner=None):
+        self.Name = name
+        self.Inner = inner
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if self.Inner is not None:
+            return self.Inner.__get__(obj, objtype)
+        try:
+            return obj.__dict__[self.Name]
+        except KeyError:
+            raise AttributeError(self.Name)
+
+    def __set__(self, obj, value):
+        if self.Inner is not None:
+            self.Inner.__set__(obj, value)
+        else:
+            obj.__dict__[self.Name] = value
+        if not obj.IsFrozen:
+            obj.fieldChanged(self.Name)
+
+
+class ORMClass(type):
+    """
+    Make the ORM_ATTRIBUTES of a class into ORMFields, and work out the dirty bit
+    and update topic of each, so setting them doesn't build any of this each time.
+    """
+    def __init__(cls, name, bases, namespace):
+        type.__init__(cls, name, bases, namespace)
+        if "ORM_ATTRIBUTES" in namespace:
+            for attrname in cls.ORM_ATTRIBUTES:
+                inner = None
+                for klass in cls.__mro__:
+                    if attrname in klass.__dict__:
+                        inner = klass.__dict__[attrname]
+                        break
+                if isinstance(inner, ORMField):
+                    inner = inner.Inner
+                elif not hasattr(inner, "__set__"):
+                    inner = None
+                setattr(cls, attrname, ORMField(attrname, inner))
+        cls.ORM_BITS = dict((attrname, 1 << i) for i, attrname in enumerate(cls.ORM_ATTRIBUTES))
+        cls.ORM_TOPICS = dict((attrname, ("ormobject", "updated", name, attrname.strip("_"))) for attrname in cls.ORM_ATTRIBUTES)
+
+
 class ORMObject(object):
+    __metaclass__ = ORMClass
+    # Empty so subclasses can use __slots__; those that don't still get a __dict__.
+    __slots__ = ()
     ORM_TABLE = None
     ORM_ATTRIBUTES = []
     
     def __init__(self):
         self.IsFrozen = True
-        # If the object doesn't have an ID, we need to set one for setattr.
+        # If the object doesn't have an ID, we need to set one for fieldChanged.
         if not hasattr(self, "ID"):
             self.ID = None
+        # A bit per ORM_ATTRIBUTES field changed since the store last wrote this object.
+        self.DirtyFields = 0
         self.IsFrozen = False
         
-    def __setattr__(self, attrname, val):
-        object.__setattr__(self, attrname, val)
-        if not self.IsFrozen and self.ID is not None:
-            self.publishIfAppropriate(attrname, val)
+    def fieldChanged(self, attrname):
+        if self.ID is not None:
+            self.markDirty(attrname)
 
-    def publishIfAppropriate(self, attrname, val):
-        if attrname in self.ORM_ATTRIBUTES:
-            classname = self.__class__.__name__
-            Publisher.sendMessage("ormobject.updated.%s.%s" % (classname, attrname.strip("_")), self)
+    def markDirty(self, attrname):
+        bit = self.ORM_BITS.get(attrname)
+        # A field of a base class, like Transaction._Amount under RecurringTransaction.Amount.
+        if bit is None:
+            return
+        wasClean = not self.DirtyFields
+        self.DirtyFields |= bit
+        # The store only needs to hear about the object once until it writes it.
+        if wasClean:
+            Publisher.sendMessage("ormobject.dirty", self)
+        Publisher.sendMessage(self.ORM_TOPICS[attrname], self)
             
     def getAttrValue(self, attrname):
         from wxbanker.bankobjects.account import Account
@@ -69,11 +133,11 @@ class ORMKeyValueObject(ORMObject):
     """
     def __init__(self, store):
         self.IsFrozen = True
+        self.DirtyFields = 0
         store.PopulateKeyValues(self)
         self.IsFrozen = False
     
-    def __setattr__(self, attrname, val):
-        object.__setattr__(self, attrname, val)
-        if not self.IsFrozen:
-            self.publishIfAppropriate(attrname, val)
+    def fieldChanged(self, attrname):
+        # Its values are keyed by name, so there is no ID to wait for.
+        self.markDirty(attrname)
             
\ No newline at end of file
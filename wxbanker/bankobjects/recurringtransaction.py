@@ -20,6 +20,7 @@
 
 from wxbanker import localization
 import datetime, functools, gettext
+from wx.lib.pubsub import Publisher
 from dateutil import rrule
 
 from wxbanker import helpers
@@ -55,18 +56,28 @@ class RecurringTransaction(Transaction, ORMObject):
         self.LastTransacted = lastTransacted
         self.IsFrozen = False
         
+    def getAttrValue(self, attrname):
+        # Unlike transactions, recurring transactions still store their dates as strings.
+        return ORMObject.getAttrValue(self, attrname)
+
     def IsWeekly(self):
         return self.RepeatType == self.WEEKLY
         
     def PerformTransactions(self):
-        for date in self.GetUntransactedDates():
-            result = self.Parent.AddTransaction(self.Amount, self.Description, date, self.Source)
-            if isinstance(result, Transaction):
-                result = (result,)
-            for transaction in result:
-                transaction.RecurringParent = self
+        # Add them all at once, so each account involved gets one transactions.created message.
+        transactions = [Transaction(None, self.Parent, self.Amount, self.Description, date) for date in self.GetUntransactedDates()]
+        # Not stored yet, so the recurring parent is stored along with them.
+        for transaction in transactions:
+            transaction.RecurringParent = self
+        Publisher.sendMessage("batch.start")
+        if transactions:
+            self.Parent.AddTransactions(transactions, [self.Source] * len(transactions))
+        for transaction in transactions:
+            if transaction.LinkedTransaction:
+                transaction.LinkedTransaction.RecurringParent = self
         
         self.LastTransacted = datetime.date.today()
+        Publisher.sendMessage("batch.end")
         
     def GetRRule(self):
         """Generate the dateutils.rrule for this recurring transaction."""
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+#    https://launchpad.net/wxbanker
+#    searchsession.py: Copyright 2007-2010 Mike Rooney <mrooney@ubuntu.com>
+#
+#    This file is part of wxBanker.
+#
+#    wxBanker is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    wxBanker is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with wxBanker.  If not, see <http://www.gnu.org/licenses/>.
+
+from wx.lib.pubsub import Publisher
+import wx.lib.delayedresult as delayedresult
+import re
+
+
+class SearchSession(object):
+    """
+    Searches of a model as they are typed. Each search remembers its matches, so when the
+    next one just extends it, like "groc" after "gro", those matches are filtered instead
+    of searching everything again. Anything else, such as a broader search, a range or a
+    regular expression, goes to BankModel.Search. Changes to transactions start over.
+
+    SearchInBackground does the filtering on a worker thread, numbering each search so
+    only the results of the latest one are delivered.
+    """
+    # Past this many matches, the full-text index finds words faster than filtering them.
+    WORDS_REFINE_LIMIT = 10000
+    # Filtering fewer transactions than this is quicker than handing them to a worker.
+    BACKGROUND_MIN = 5000
+
+    def __init__(self, model):
+        self.Model = model
+        self.Generation = 0
+        self.Resets = 0
+        self.Reset()
+
+        for topic in ("transaction.created", "transactions.created", "transactions.removed", "ormobject.updated.Transaction"):
+            Publisher.subscribe(self.onTransactionsChanged, topic)
+
+    def Reset(self):
+        self.Resets += 1
+        self.LastSearch = None
+        self.LastMatches = None
+
+    def Cancel(self):
+        """Drop the results of any searches still running, and start over."""
+        self.Generation += 1
+        self.Reset()
+
+    def Search(self, searchString, account=None, matchIndex=1, regex=False):
+        search, candidates, predicate = self.prepare(searchString, account, matchIndex, regex)
+        return self.finish(search, self.Resets, self.filter(candidates, predicate))
+
+    def SearchInBackground(self, callback, searchString, account=None, matchIndex=1, regex=False):
+        """
+        Search like Search, calling callback(matches) on the main thread once it's done
+        unless another search has started or Cancel was called by then.
+        Return the generation of this search.
+        """
+        self.Generation += 1
+        generation, resets = self.Generation, self.Resets
+        search, candidates, predicate = self.prepare(searchString, account, matchIndex, regex)
+
+        if len(candidates) < self.BACKGROUND_MIN:
+            callback(self.finish(search, resets, self.filter(candidates, predicate)))
+            return generation
+
+        def consumer(result):
+            if generation == self.Generation:
+                callback(self.finish(search, resets, result.get()))
+
+        delayedresult.startWorker(consumer, self.filter, wargs=(candidates, predicate), jobID=generation)
+        return generation
+
+    def prepare(self, searchString, account, matchIndex, regex):
+        """
+        Return the search, the transactions which could match and a predicate picking the
+        ones which do. Anything using the store, whose connection belongs to this thread, and
+        the loading of transactions happens here, leaving a filter safe to run on a worker.
+        """
+        kind = self.Model.GetSearchKind(searchString, matchIndex, regex)
+        search = (searchString, account, matchIndex, regex, kind)
+
+        if self.isRefinement(search):
+            candidates = self.LastMatches
+        elif kind in ("regex", "literal"):
+            if account is None:
+                candidates = self.Model.GetTransactions()
+            else:
+                candidates = account.Transactions[:]
+        else:
+            # Index backed searches are quick, but only from this thread.
+            return search, self.Model.Search(searchString, account=account, matchIndex=matchIndex, regex=regex), None
+
+        return search, candidates, self.getPredicate(searchString, matchIndex, kind)
+
+    def filter(self, candidates, predicate):
+        if predicate is None:
+            return candidates
+        return [trans for trans in candidates if predicate(trans)]
+
+    def finish(self, search, resets, matches):
+        # Matches from before a change to the transactions can't be refined later.
+        if resets == self.Resets:
+            self.LastSearch = search
+            # Keep a copy, since the caller is free to modify what we return.
+            self.LastMatches = list(matches)
+        return matches
+
+    def isRefinement(self, search):
+        """Return whether the matches of search are a subset of the last matches."""
+        if self.LastSearch is None:
+            return False
+
+        searchString, account, matchIndex, regex, kind = search
+        lastString, lastAccount, lastMatchIndex, lastRegex, lastKind = self.LastSearch
+        # Only extending words or a literal narrows the matches; a regex can do anything.
+        if kind not in ("words", "literal") or kind != lastKind:
+            return False
+        if kind == "words" and len(self.LastMatches) > self.WORDS_REFINE_LIMIT:
+            return False
+        return account is lastAccount and matchIndex == lastMatchIndex and regex == lastRegex and searchString.startswith(lastString)
+
+    def getPredicate(self, searchString, matchIndex, kind):
+        if kind == "words":
+            # Match just as the model's search does.
+            return self.Model.GetWordsPredicate(searchString)
+
+        pattern = re.compile(searchString, flags=re.IGNORECASE)
+        return lambda trans: self.Model.patternMatches(pattern, trans, matchIndex)
+
+    def onTransactionsChanged(self, message):
+        self.Reset()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+#
+#    https://launchpad.net/wxbanker
+#    sortedindex.py: Copyright 2007-2010 Mike Rooney <mrooney@ubuntu.com>
+#
+#    This file is part of wxBanker.
+#
+#    wxBanker is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    wxBanker is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with wxBanker.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+
+class SortedIndex(object):
+    """
+    Transactions sorted by a key such as Date or Amount, so the ones with
+    a key within a range can be found by bisection instead of a scan.
+    """
+    def __init__(self, transactions, key):
+        self.Transactions = sorted(transactions, key=lambda t: (key(t), t.ID))
+        self.Keys = [key(t) for t in self.Transactions]
+
+    def Between(self, low=None, high=None):
+        """Return the transactions with low <= key <= high, where either bound may be None."""
+        start = 0
+        if low is not None:
+            start = bisect.bisect_left(self.Keys, low)
+        end = len(self.Keys)
+        if high is not None:
+            end = bisect.bisect_right(self.Keys, high)
+        return self.Transactions[start:end]
@@ -26,8 +26,27 @@ from wxbanker.bankobjects.ormobject import ORMObject
 from wxbanker.bankobjects.tag import Tag, EmptyTagException
 from wxbanker import debug
 
-from wxbanker.currencies import CurrencyList
-from wxbanker.currconvert import CurrencyConverter
+from wxbanker.currencies import amount2units, units2amount
+from wxbanker.currconvert import GetConverter
+
+# The tags of every untagged transaction, which is most of them.
+NO_TAGS = frozenset()
+
+# Descriptions and dates repeat a lot ("Groceries" every week, many transactions a day),
+# so transactions share equal ones. The store empties these when it closes or reloads its
+# model, since unicode and date objects can't be weakly referenced to drop them any sooner.
+descriptionCache = {}
+dateCache = {}
+
+def clearInternCaches():
+    descriptionCache.clear()
+    dateCache.clear()
+
+def internDescription(description):
+    return descriptionCache.setdefault(description, description)
+
+def internDate(date):
+    return dateCache.setdefault(date, date)
 
 class Transaction(ORMObject):
     """
@@ -38,8 +57,11 @@ class Transaction(ORMObject):
     """
     ORM_TABLE = "transactions"
     ORM_ATTRIBUTES = ["_Amount", "_Description", "_Date", "LinkedTransaction", "RecurringParent"]
+    # Slots rather than a __dict__ per transaction, as there can be hundreds of thousands.
+    __slots__ = ("IsFrozen", "DirtyFields", "ID", "Parent", "RecurringParent", "_LinkedTransaction", "_Date", "_Description",
+                 "_Tags", "_Amount", "PreviousDate", "PreviousAmount", "_Total")
     
-    def __init__(self, tID, parent, amount, description, date):
+    def __init__(self, tID, parent, amount, description, date, tags=None):
         ORMObject.__init__(self)
         self.IsFrozen = True
 
@@ -47,8 +69,13 @@ class Transaction(ORMObject):
         self.LinkedTransaction = None
         self.Parent = parent
         self.Date = date
-        self.Tags = set()
-        self.Description = description
+        if tags is None:
+            self.Tags = NO_TAGS
+            self.Description = description
+        else:
+            # The tags are already known (from the store's tag index), so skip parsing the description.
+            self.Tags = tags or NO_TAGS
+            self._Description = internDescription(unicode(description))
         self.Amount = amount
         self.RecurringParent = None
 
@@ -59,13 +86,16 @@ class Transaction(ORMObject):
 
     def SetDate(self, date, fromLink=False):
         date = self._MassageDate(date)
-        self._Date = date
+        # Remember the old date, so the account can find where the transaction was.
+        self.PreviousDate = getattr(self, "_Date", None)
+        self._Date = internDate(date)
         
         # Update the linked transaction if one exists.
         if not fromLink and self.LinkedTransaction:
             self.LinkedTransaction.SetDate(date, fromLink=True)
 
-    def _MassageDate(self, date):
+    @staticmethod
+    def _MassageDate(date):
         """
         Takes a date and returns a valid datetime.date object.
         `date` can be a datetime object, or a string. In the case of a string, valid separators are '-' and '/'.
@@ -73,6 +103,9 @@ class Transaction(ORMObject):
         """
         if date is None:
             return datetime.date.today()
+        # Already a date, as when loaded from the store; there is nothing to parse.
+        if type(date) is datetime.date:
+            return date
         # The maximum number of years you can refer to in the future, using an abbreviation.
         # Ex: If it is 2008 and MAX_FUTURE_ABBR is 10, years 9-18 will become 2009-2018,
         # while 19-99 will become 1919-1999.
@@ -109,12 +142,22 @@ class Transaction(ORMObject):
     def SetDescription(self, description, fromLink=False):
         """Update the description, ensuring it is a string."""
         description = unicode(description)
-        self._Description = description
+
+        # Update tags first, so they are current when the description change is stored.
+        tags = self.ParseTags(description)
+        removedTags = self._Tags.difference(tags)
+        addedTags = tags.difference(self._Tags)
+        self.TagsRemoved(removedTags)
+        self.TagsAdded(addedTags)
+
+        self._Description = internDescription(description)
         # Update the linked transaction if one exists.
         if not fromLink and self.LinkedTransaction:
             self.LinkedTransaction.SetDescription(description, fromLink=True)
-            
-        # Parse/update tags.
+
+    @staticmethod
+    def ParseTags(description):
+        """Return the set of Tags in a description."""
         tags = set()
         for word in description.split(" "):
             if word.startswith("#"):
@@ -125,19 +168,21 @@ class Transaction(ORMObject):
                     # This is not so good but, we can't argue with the description, it just isn't a tag.
                     continue
                 tags.add(tag)
-        
-        removedTags = self._Tags.difference(tags)
-        addedTags = tags.difference(self._Tags)
-        self.TagsRemoved(removedTags)
-        self.TagsAdded(addedTags)
+        return tags
         
     def TagsAdded(self, tagNames):
-        self.Tags.update(tagNames)
-        Publisher.sendMessage("transaction.tagged", tagNames)
+        # Replace rather than update the tags, as they may be the shared NO_TAGS.
+        if tagNames:
+            self._Tags = self._Tags.union(tagNames)
+            # Transactions being built are quiet, their tags are announced with them.
+            if not self.IsFrozen:
+                Publisher.sendMessage("transaction.tagged", tagNames)
     
     def TagsRemoved(self, tagNames):
-        self.Tags.difference_update(tagNames)
-        Publisher.sendMessage("transaction.untagged", tagNames)
+        if tagNames:
+            self._Tags = self._Tags.difference(tagNames) or NO_TAGS
+            if not self.IsFrozen:
+                Publisher.sendMessage("transaction.untagged", tagNames)
         
     def AddTag(self, tagName):
         tag = Tag(tagName)
@@ -157,21 +202,29 @@ class Transaction(ORMObject):
 
     def GetAmount(self, currency=None):
         if currency:
-            conv = CurrencyConverter()
-            destCurrency = CurrencyList[currency]().GetCurrencyNick() 
-            srcCurrency = self.Parent.GetCurrency().GetCurrencyNick()
-            return conv.Convert(self._Amount, srcCurrency, destCurrency)
+            return GetConverter().ConvertIndex(self._Amount, self.Parent.GetCurrencyIndex(), currency)
         return self._Amount
 
     def SetAmount(self, amount, fromLink=False):
-        """Update the amount, ensuring it is a float."""
-        amount = float(amount)
+        """Update the amount, ensuring it is a float of whole units (see currencies.AMOUNT_DIGITS)."""
+        amount = units2amount(amount2units(float(amount)))
+        # Remember the old amount, so the account can adjust its balance by the difference.
+        self.PreviousAmount = getattr(self, "_Amount", None)
         self._Amount = amount
         
         # Update the linked transaction if one exists.
         if not fromLink and self.LinkedTransaction:
             self.LinkedTransaction.SetAmount(-amount, fromLink=True)
 
+    def getAttrValue(self, attrname):
+        # Dates are stored as day ordinals so they load and compare without any string handling.
+        if attrname in ("Date", "_Date"):
+            return self._Date.toordinal()
+        # Likewise amounts are stored as integer units, so sums in SQL are exact.
+        if attrname in ("Amount", "_Amount"):
+            return amount2units(self._Amount)
+        return ORMObject.getAttrValue(self, attrname)
+
     def GetLinkedTransaction(self):
         return self._LinkedTransaction
 
@@ -18,13 +18,64 @@
 #    You should have received a copy of the GNU General Public License
 #    along with wxBanker.  If not, see <http://www.gnu.org/licenses/>.
 
+import operator
+
+# The (Date, ID) of a transaction, made in C as this is called for every transaction in a sort.
+sortKey = operator.attrgetter("_Date", "ID")
+
+
 class TransactionList(list):
+    """
+    An account's transactions, always sorted by (Date, ID) so nothing else needs to
+    sort them. Transactions are inserted by bisection, and the account repositions
+    one when its date changes.
+    """
     def __init__(self, items=None):
         # list does not understand items=None apparently.
         if items is None:
             items = []
 
         list.__init__(self, items)
+        self.sort(key=sortKey)
+
+    def bisect(self, key):
+        """Return the index to insert a transaction with the (Date, ID) key, after any equal ones."""
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if key < sortKey(self[mid]):
+                high = mid
+            else:
+                low = mid + 1
+        return low
+
+    def append(self, transaction):
+        # New transactions usually belong at the end.
+        if self and sortKey(transaction) < sortKey(self[-1]):
+            self.insert(self.bisect(sortKey(transaction)), transaction)
+        else:
+            list.append(self, transaction)
+
+    def extend(self, transactions):
+        transactions = sorted(transactions, key=sortKey)
+        if not transactions or not self or sortKey(transactions[0]) >= sortKey(self[-1]):
+            list.extend(self, transactions)
+        elif len(transactions) < 100:
+            for transaction in transactions:
+                self.append(transaction)
+        else:
+            list.extend(self, transactions)
+            # Sorting two sorted runs is a single merge.
+            self.sort(key=sortKey)
+
+    def Reposition(self, transaction, previousDate):
+        """Move the transaction to its place for its new date, having been at the previous date."""
+        index = self.bisect((previousDate, transaction.ID)) - 1
+        if index < 0 or self[index] is not transaction:
+            # It wasn't where it should have been, so look for it the slow way.
+            index = [id(t) for t in self].index(id(transaction))
+        del self[index]
+        self.append(transaction)
 
     def __eq__(self, other):
         if not len(self) == len(other):
@@ -26,8 +26,9 @@ class Controller(object):
     CONFIG_NAME = "wxBanker.cfg"
     DB_NAME = "bank.db"
     
-    def __init__(self, path=None):
+    def __init__(self, path=None, groupCommit=False):
         self._AutoSave = True
+        self.GroupCommit = groupCommit
         self._ShowZeroBalanceAccounts = True
         self._ShowCurrencyNick = True
         self.Models = []
@@ -142,7 +143,7 @@ class Controller(object):
         if path is None:
             path = fileservice.getDataFilePath(self.DB_NAME)
 
-        store = PersistentStore(path)
+        store = PersistentStore(path, groupCommit=self.GroupCommit)
         store.AutoSave = self.AutoSave
         model = store.GetModel()
 
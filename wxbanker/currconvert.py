@@ -18,15 +18,18 @@
 #    You should have received a copy of the GNU General Public License
 #    along with wxBanker.  If not, see <http://www.gnu.org/licenses/>.
 
-from wxbanker import localization, fileservice
+from wxbanker import localization, fileservice, currencies
 from xml.etree import ElementTree
+import os, time
 
 class ConversionException(Exception): pass
 
 class CurrencyConverter(object):
-    def __init__(self):
+    def __init__(self, path=None):
         self.Exchanges = {"EUR": 1.0}
-        self.OriginalPath = fileservice.getSharedFilePath("exchanges.xml")
+        self.OriginalPath = path or fileservice.getSharedFilePath("exchanges.xml")
+        self.Modified = os.path.getmtime(self.OriginalPath)
+        self.rates = None
         self._loadExchanges()
 
     def _loadExchanges(self):
@@ -54,15 +57,70 @@ class CurrencyConverter(object):
         toRate = self.Exchanges.get(toStr)
 
         # Make sure we have an exchange rate for each currency.
-        for rate in (fromRate, toRate):
+        for currency, rate in ((fromStr, fromRate), (toStr, toRate)):
             if rate is None:
-                raise ConversionException(_('No exchange rate for currency "%s"') % rate)
+                raise ConversionException(_('No exchange rate for currency "%s"') % currency)
 
         middle = amount * (1.0 / fromRate)
         end = middle * toRate
 
         return end
 
+    def GetRates(self):
+        """
+        Return the matrix of rates between the currencies in currencies.CurrencyList,
+        so rates[i][j] converts from the ith currency to the jth, or is None without one.
+        It is built from Exchanges on first use.
+        """
+        if self.rates is None:
+            nicks = [currency().GetCurrencyNick() for currency in currencies.CurrencyList]
+            self.rates = [[self.getRate(fromNick, toNick) for toNick in nicks] for fromNick in nicks]
+        return self.rates
+
+    def getRate(self, fromNick, toNick):
+        if fromNick == toNick:
+            return 1.0
+        fromRate, toRate = self.Exchanges.get(fromNick), self.Exchanges.get(toNick)
+        if fromRate is None or toRate is None:
+            return None
+        return (1.0 / fromRate) * toRate
+
+    def GetRate(self, original, destination):
+        """Return the rate between two currencies given as indexes into currencies.CurrencyList."""
+        rate = self.GetRates()[original][destination]
+        if rate is None:
+            raise ConversionException(_('No exchange rate from "%s" to "%s"') % (currencies.CurrencyList[original]().GetCurrencyNick(), currencies.CurrencyList[destination]().GetCurrencyNick()))
+        return rate
+
+    def ConvertIndex(self, amount, original, destination):
+        """Like Convert, but with currencies as indexes into currencies.CurrencyList."""
+        if original == destination:
+            return amount
+        return amount * self.GetRate(original, destination)
+
+
+# The converter shared by everything, see GetConverter.
+sharedConverter = None
+# How often, in seconds, to check if the rates file changed.
+RATES_CHECK_INTERVAL = 5
+lastRatesCheck = 0
+
+def GetConverter():
+    """
+    Return the converter shared by the process, rather than parsing the rates for every
+    conversion. It is replaced when the rates file changes, checked every RATES_CHECK_INTERVAL.
+    """
+    global sharedConverter, lastRatesCheck
+    if sharedConverter is None:
+        sharedConverter = CurrencyConverter()
+        lastRatesCheck = time.time()
+    elif time.time() - lastRatesCheck > RATES_CHECK_INTERVAL:
+        lastRatesCheck = time.time()
+        path = fileservice.getSharedFilePath("exchanges.xml")
+        if path != sharedConverter.OriginalPath or os.path.getmtime(path) != sharedConverter.Modified:
+            sharedConverter = CurrencyConverter(path)
+    return sharedConverter
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -24,6 +24,23 @@
 import locale
 from wxbanker import localization
 
+# Amounts are stored and summed as integers in units of 10**-AMOUNT_DIGITS, which is
+# fine-grained enough for the frac_digits of any currency here, so totals are exact.
+AMOUNT_DIGITS = 3
+AMOUNT_SCALE = 10 ** AMOUNT_DIGITS
+
+def amount2units(amount):
+    """Convert a float amount into the nearest integer number of units."""
+    return int(round(amount * AMOUNT_SCALE))
+
+def units2amount(units):
+    """Convert an integer number of units back into a float amount."""
+    return float(units) / AMOUNT_SCALE
+
+def sumAmounts(amounts):
+    """Sum float amounts exactly, without the drift of adding the floats themselves."""
+    return units2amount(sum(amount2units(amount) for amount in amounts))
+
 def createFromLocale(currencyName):
     """Create a currency class from the current locale."""
     import os
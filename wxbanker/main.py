@@ -226,7 +226,8 @@ def init(path=None, welcome=True):
     from wxbanker import fileservice
     from wxbanker.controller import Controller
 
-    bankController = Controller(path)
+    # Group auto-saved writes into fewer commits, since the main loop is there to flush them.
+    bankController = Controller(path, groupCommit=True)
     
     # We can initialize the wx locale now that the wx.App is initialized.
     localization.initWxLocale()
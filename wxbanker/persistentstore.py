@@ -17,53 +17,95 @@
 #    along with wxBanker.  If not, see <http://www.gnu.org/licenses/>.
 
 """
-Table: accounts                                v2                 v3              v10
-+---------------------------------------------------------------+---------------+-----------------+
-| id INTEGER PRIMARY KEY | name VARCHAR(255) | currency INTEGER | balance FLOAT | mintId INTEGER  |
-|------------------------+-------------------+------------------+---------------+-----------------|
-| 1                      | "My Account"      | 0                | 0             | 123456          |
-+---------------------------------------------------------------+---------------+-----------------+
-
-Table: transactions                                                                                       v4
-+-------------------------------------------------------------------------------------------------------+----------------+
-| id INTEGER PRIMARY KEY | accountId INTEGER | amount FLOAT | description VARCHAR(255) | date CHAR(10)) | linkId INTEGER |
-|------------------------+-------------------+--------------+--------------------------+----------------|----------------|
-| 1                      | 1                 | 100.00       | "Initial Balance"        | "2007/01/06"   | null           |
-+-------------------------------------------------------------------------------------------------------+----------------+
+The schema as of version 18. Amounts and balances are integer units of 10**-3 (see
+currencies.amount2units) since v16, and dates are day ordinals (see datetime.date.toordinal)
+since v15. Only the main tables are shown; see upgradeDb for the rest, such as meta,
+recurring_transactions and the transactions_fts full-text index (v18).
+
+Table: accounts                                v2                 v3                v10
++---------------------------------------------------------------+-----------------+-----------------+
+| id INTEGER PRIMARY KEY | name VARCHAR(255) | currency INTEGER | balance INTEGER | mintId INTEGER  |
+|------------------------+-------------------+------------------+-----------------+-----------------|
+| 1                      | "My Account"      | 0                | 100000          | 123456          |
++---------------------------------------------------------------+-----------------+-----------------+
+
+Table: transactions                                                                                     v4               v7
++-----------------------------------------------------------------------------------------------------+----------------+-------------------------+
+| id INTEGER PRIMARY KEY | accountId INTEGER | amount INTEGER | description VARCHAR(255) | date INTEGER | linkId INTEGER | recurringParent INTEGER |
+|------------------------+-------------------+----------------+--------------------------+--------------+----------------+-------------------------|
+| 1                      | 1                 | 100000         | "Initial Balance"        | 732682       | null           | null                    |
++-----------------------------------------------------------------------------------------------------+----------------+-------------------------+
+
+Table: tags (v17)                               Table: transactions_tags_link (v17)
++-------------------------+-------------------+  +-------------------------+-----------------------+---------------+
+| id INTEGER PRIMARY KEY  | name VARCHAR(255) |  | id INTEGER PRIMARY KEY  | transactionId INTEGER | tagId INTEGER |
+|-------------------------+-------------------|  |-------------------------+-----------------------+---------------|
+| 1                       | "groceries"       |  | 1                       | 1                     | 1             |
++-------------------------+-------------------+  +-------------------------+-----------------------+---------------+
 """
 
 import ast
 import datetime
 import os
 import sys
+import time
 
 from sqlite3 import dbapi2 as sqlite
 import sqlite3
+import wx
 from wx.lib.pubsub import Publisher
 
 from wxbanker import currencies, debug
+from wxbanker.currencies import amount2units, units2amount
 from wxbanker.bankobjects.account import Account
 from wxbanker.bankobjects.accountlist import AccountList
 from wxbanker.bankobjects.bankmodel import BankModel
-from wxbanker.bankobjects.transaction import Transaction
+from wxbanker.bankobjects.transaction import Transaction, NO_TAGS, clearInternCaches
+from wxbanker.bankobjects.tag import Tag
 from wxbanker.bankobjects.transactionlist import TransactionList
 from wxbanker.bankobjects.recurringtransaction import RecurringTransaction
 from wxbanker.bankobjects.ormobject import ORMKeyValueObject
-from wxbanker.bankexceptions import MissingLinkException
 
 class PersistentStore:
     """
     Handles creating the Model (bankobjects) from the store and writing
     back the changes.
-    """
 
-    def __init__(self, path, autoSave=True):
+    With groupCommit enabled, auto-saved writes are committed together once
+    COMMIT_WINDOW seconds have passed or COMMIT_MAX_PENDING writes are pending,
+    instead of once per write.
+
+    Attribute updates from ORM objects are coalesced: objects mark their
+    changed fields dirty and are queued once, so repeated updates to the same
+    value collapse into one, and their fields are written together just before
+    the next commit or any other statement.
+
+    All of this happens on the calling thread, the UI one in the application,
+    with the store's single connection. Grouping makes the statements, commits
+    and syncs fewer, but each flush and commit still runs where it is triggered.
+    """
+    COMMIT_WINDOW = .25
+    COMMIT_MAX_PENDING = 500
+    # ORM attributes whose columns aren't just the lowerCamelCase attribute name.
+    ORM_COLUMNS = {"RepeatOn": "repeatsOn", "Source": "sourceId", "LinkedTransaction": "linkId"}
+    # The default SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions.
+    SQL_VARIABLE_LIMIT = 999
+
+    def __init__(self, path, autoSave=True, groupCommit=False):
         self.Subscriptions = []
-        self.Version = 13
+        self.Version = 18
         self.Path = path
         self.AutoSave = False
+        self.GroupCommit = groupCommit
         self.Dirty = False
         self.BatchDepth = 0
+        self.PendingWrites = 0
+        self.pendingSince = None
+        self.commitTimer = None
+        # ORM objects with dirty fields to write; see flushUpdates.
+        self.dirtyObjects = []
+        # Tag names to their ids in the tags table, filled as they are needed.
+        self.tagIds = {}
         self.cachedModel = None
         # Upgrades can't enable syncing if needed from older versions.
         self.needsSync = False
@@ -76,8 +118,7 @@ class PersistentStore:
         # Initialize the connection and optimize it.
         connection = sqlite.connect(self.Path)
         self.dbconn = connection
-        # Disable synchronous I/O, which makes everything MUCH faster, at the potential cost of durability.
-        self.dbconn.execute("PRAGMA synchronous=OFF;")
+        self.initJournal()
 
         # If the db doesn't exist, initialize it.
         if not existed:
@@ -93,10 +134,13 @@ class PersistentStore:
             self.upgradeDb(self.Meta['VERSION'], backup=existed)
             self.Meta = self.getMeta()
             debug.debug(self.Meta)
+
+        # The full-text index is only there if this SQLite could create it, see upgradeDb.
+        self.FullTextSearch = self.dbconn.cursor().execute("SELECT COUNT(*) FROM sqlite_master WHERE name='transactions_fts'").fetchone()[0] > 0
          
         # We have to subscribe before syncing otherwise it won't get synced if there aren't other changes.
         self.Subscriptions = (
-            (self.onORMObjectUpdated, "ormobject.updated"),
+            (self.onORMObjectDirty, "ormobject.dirty"),
             (self.onAccountBalanceChanged, "account.balance changed"),
             (self.onAccountRemoved, "account.removed"),
             (self.onBatchEvent, "batch"),
@@ -116,6 +160,7 @@ class PersistentStore:
     def GetModel(self, useCached=True):
         if self.cachedModel is None or not useCached:
             debug.debug('Creating model...')
+            clearInternCaches()
             self.cachedModel = BankModel(self)
 
         return self.cachedModel
@@ -127,7 +172,7 @@ class PersistentStore:
         if type(currency) != int or currency < 0:
             raise Exception("Currency code must be int and >= 0")
 
-        cursor = self.dbconn.cursor()
+        cursor = self.cursor()
         cursor.execute('INSERT INTO accounts (name, currency) VALUES (?, ?)', (accountName, currency))
         ID = cursor.lastrowid
         self.commitIfAppropriate()
@@ -136,49 +181,198 @@ class PersistentStore:
         return account
 
     def RemoveAccount(self, account):
-        self.dbconn.cursor().execute('DELETE FROM accounts WHERE id=?',(account.ID,))
+        self.cursor().execute('DELETE FROM accounts WHERE id=?',(account.ID,))
         self.commitIfAppropriate()
         
     def MakeRecurringTransaction(self, recurring):
-        cursor = self.dbconn.cursor()
+        cursor = self.cursor()
         cursor.execute('INSERT INTO recurring_transactions VALUES (null, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self.recurringtransaction2result(recurring)[1:])
         self.commitIfAppropriate()
         recurring.ID = cursor.lastrowid
         return recurring
 
     def MakeTransaction(self, account, transaction):
-        cursor = self.dbconn.cursor()
+        cursor = self.cursor()
         cursor.execute('INSERT INTO transactions VALUES (null, ?, ?, ?, ?, ?, ?)', [account.ID] + transaction.toResult()[1:])
-        self.commitIfAppropriate()
         transaction.ID = cursor.lastrowid
+        self.insertTags([transaction])
+        self.commitIfAppropriate()
         return transaction
 
-    def RemoveTransaction(self, transaction):
-        ID = transaction.ID
-        result = self.dbconn.cursor().execute('DELETE FROM transactions WHERE id=?', (ID,)).fetchone()
+    def MakeTransactions(self, account, transactions):
+        """Store many transactions in an account with a single statement."""
+        cursor = self.cursor()
+        # executemany doesn't tell us each new rowid, so pick the IDs the way SQLite would.
+        lastId = cursor.execute('SELECT MAX(id) FROM transactions').fetchone()[0] or 0
+        ids = range(lastId + 1, lastId + 1 + len(transactions))
+        rows = [[tId, account.ID] + transaction.toResult()[1:] for tId, transaction in zip(ids, transactions)]
+        cursor.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        for tId, transaction in zip(ids, transactions):
+            transaction.ID = tId
+        self.insertTags(transactions)
         self.commitIfAppropriate()
-        # The result doesn't appear to be useful here, it is None regardless of whether the DELETE matched anything.
-        return True
-    
+        return transactions
+
+    def GetTransactionSum(self, account, startDate=None, endDate=None):
+        """Return the total of the account's transactions between the dates, inclusive, without loading them."""
+        query, args = 'SELECT SUM(amount) FROM transactions WHERE accountId=?', [account.ID]
+        if startDate is not None:
+            query += ' AND date >= ?'
+            args.append(startDate.toordinal())
+        if endDate is not None:
+            query += ' AND date <= ?'
+            args.append(endDate.toordinal())
+        return units2amount(self.cursor().execute(query, args).fetchone()[0] or 0)
+
+    def RemoveTransactions(self, transactions):
+        ids = [t.ID for t in transactions]
+        self.executeForIds('DELETE FROM transactions WHERE id IN (%s)', ids)
+        self.executeForIds('DELETE FROM transactions_tags_link WHERE transactionId IN (%s)', ids)
+        self.commitIfAppropriate()
+
+    def UnlinkTransactions(self, transactions):
+        self.executeForIds('UPDATE transactions SET linkId=NULL WHERE id IN (%s)', [t.ID for t in transactions])
+        self.commitIfAppropriate()
+
+    def executeForIds(self, query, ids):
+        """Run a query with an "IN (%s)" clause for the IDs, in chunks small enough for SQLite's variable limit."""
+        cursor = self.cursor()
+        for i in range(0, len(ids), self.SQL_VARIABLE_LIMIT):
+            chunk = ids[i:i+self.SQL_VARIABLE_LIMIT]
+            cursor.execute(query % ",".join("?" * len(chunk)), chunk)
+
+    def getTagId(self, tag):
+        """Return the id of the tag in the tags table, adding it if it is new."""
+        if tag.Name not in self.tagIds:
+            cursor = self.cursor()
+            result = cursor.execute('SELECT id FROM tags WHERE name=?', (tag.Name,)).fetchone()
+            if result is None:
+                cursor.execute('INSERT INTO tags VALUES (null, ?)', (tag.Name,))
+                self.tagIds[tag.Name] = cursor.lastrowid
+            else:
+                self.tagIds[tag.Name] = result[0]
+        return self.tagIds[tag.Name]
+
+    def insertTags(self, transactions):
+        """Add the tags of stored transactions to the tag index."""
+        rows = [(t.ID, self.getTagId(tag)) for t in transactions for tag in t.Tags]
+        if rows:
+            self.cursor().executemany('INSERT INTO transactions_tags_link VALUES (null, ?, ?)', rows)
+
+    def updateTags(self, transaction):
+        self.cursor().execute('DELETE FROM transactions_tags_link WHERE transactionId=?', (transaction.ID,))
+        self.insertTags([transaction])
+
+    def getTransactionTags(self):
+        """Return a map of transaction ids to their sets of Tags, from the tag index."""
+        tags = {}
+        for tId, name in self.cursor().execute('SELECT transactionId, name FROM transactions_tags_link JOIN tags ON tags.id=tagId'):
+            tags.setdefault(tId, set()).add(Tag(name))
+        return tags
+
+    def GetTagCounts(self):
+        """Return a map of the name of each tag in use to how many transactions have it."""
+        query = 'SELECT name, COUNT(*) FROM transactions_tags_link JOIN tags ON tags.id=tagId GROUP BY name'
+        return dict(self.cursor().execute(query).fetchall())
+
+    def GetTransactionIdsWithTag(self, tag):
+        query = 'SELECT transactionId FROM transactions_tags_link JOIN tags ON tags.id=tagId WHERE name=?'
+        return set(row[0] for row in self.cursor().execute(query, (tag.Name,)))
+
+    def GetTransactionIdsWithTagPrefix(self, prefix):
+        """Return the ids of transactions with a tag whose name starts with prefix, as while typing one."""
+        query = "SELECT transactionId FROM transactions_tags_link JOIN tags ON tags.id=tagId WHERE name LIKE ? ESCAPE '\\'"
+        return set(row[0] for row in self.cursor().execute(query, (self.escapeLike(prefix) + "%",)))
+
+    def SearchDescriptions(self, words):
+        """
+        Return the ids of transactions with each of the words in the description, either anywhere
+        in it, ignoring ASCII case as LIKE does, or starting one of its words according to the
+        full-text index, which ignores case and accents. BankModel.GetWordsPredicate agrees.
+        """
+        conditions, args = [], []
+        for word in words:
+            conditions.append("(id IN (SELECT docid FROM transactions_fts WHERE transactions_fts MATCH ?) OR description LIKE ? ESCAPE '\\')")
+            args.extend(('"%s*"' % word.replace('"', '""'), "%" + self.escapeLike(word) + "%"))
+        query = "SELECT id FROM transactions WHERE " + " AND ".join(conditions)
+        return set(row[0] for row in self.cursor().execute(query, args))
+
+    def GetLinkedTransactionIds(self):
+        """Return the ids of the transactions which are one side of a transfer."""
+        return set(row[0] for row in self.cursor().execute('SELECT id FROM transactions WHERE linkId IS NOT NULL'))
+
+    def escapeLike(self, text):
+        """Escape text to match literally in a LIKE pattern using ESCAPE '\\'."""
+        return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
     def RemoveRecurringTransaction(self, recurring):
         ID = recurring.ID
-        result = self.dbconn.cursor().execute('DELETE FROM recurring_transactions WHERE id=?', (ID,))
+        result = self.cursor().execute('DELETE FROM recurring_transactions WHERE id=?', (ID,))
         self.commitIfAppropriate()
 
     def Save(self):
-        import time; t = time.time()
+        self.flushUpdates()
+        t = time.time()
         self.dbconn.commit()
         debug.debug("Committed in %s seconds" % (time.time()-t))
         self.Dirty = False
+        self.PendingWrites = 0
+        self.pendingSince = None
+        if self.commitTimer is not None:
+            self.commitTimer.Stop()
+            self.commitTimer = None
+
+    def cursor(self):
+        """Return a cursor for a statement, after applying any queued updates so it sees them."""
+        self.flushUpdates()
+        return self.dbconn.cursor()
+
+    def flushUpdates(self):
+        """Write the dirty fields of the queued ORM objects, one executemany per column."""
+        if not self.dirtyObjects:
+            return
+        dirtyObjects, self.dirtyObjects = self.dirtyObjects, []
+        cursor = self.dbconn.cursor()
+        updates = {}
+        for ormobj in dirtyObjects:
+            dirty, ormobj.DirtyFields = ormobj.DirtyFields, 0
+            table = ormobj.ORM_TABLE
+            for attrname in ormobj.ORM_ATTRIBUTES:
+                if not dirty & ormobj.ORM_BITS[attrname]:
+                    continue
+                value = ormobj.getAttrValue(attrname)
+                if isinstance(ormobj, ORMKeyValueObject):
+                    cursor.execute("UPDATE %s SET value=? WHERE name=?" % table, (repr(value), attrname))
+                    continue
+                colname = self.ORM_COLUMNS.get(attrname)
+                if colname is None:
+                    # Figure out the name of the column.
+                    colname = attrname.strip("_")
+                    colname = colname[0].lower() + colname[1:]
+                updates.setdefault((table, colname), []).append((value, ormobj.ID))
+                # Keep the tag index in step with descriptions.
+                if table == "transactions" and colname == "description":
+                    self.updateTags(ormobj)
+
+        for (table, colname), rows in updates.items():
+            cursor.executemany("UPDATE %s SET %s=? WHERE id=?" % (table, colname), rows)
+        debug.debug("Flushed %i dirty object(s)" % len(dirtyObjects))
+
+    def FlushPendingCommits(self):
+        """Commit any auto-saved writes which are still waiting on the group commit window."""
+        if self.PendingWrites:
+            self.Save()
 
     def Close(self):
+        self.FlushPendingCommits()
         self.dbconn.close()
+        clearInternCaches()
         for callback, topic in self.Subscriptions:
             Publisher.unsubscribe(callback)
             
     def PopulateKeyValues(self, ormkvobj):
         table = ormkvobj.ORM_TABLE
-        for result in self.dbconn.cursor().execute("SELECT * from %s" % table).fetchall():
+        for result in self.cursor().execute("SELECT * from %s" % table).fetchall():
             autoid, key, value = result
             # eval the value since we store it repr'd. However null comes out as None, so cast to a string.
             value = ast.literal_eval(str(value))
@@ -202,12 +396,53 @@ class PersistentStore:
     def commitIfAppropriate(self):
         # Don't commit if there is a batch in progress.
         if self.AutoSave and not self.BatchDepth:
-            self.Save()
+            if self.GroupCommit:
+                self.scheduleCommit()
+            else:
+                self.Save()
         else:
             self.Dirty = True
 
+    def scheduleCommit(self):
+        """
+        Note an auto-saved write, committing right away if the group commit
+        window is full and otherwise making sure a commit happens when it closes,
+        from a timer on the main loop.
+        """
+        self.Dirty = True
+        self.PendingWrites += 1
+        now = time.time()
+        if self.pendingSince is None:
+            self.pendingSince = now
+
+        if self.PendingWrites >= self.COMMIT_MAX_PENDING or now - self.pendingSince >= self.COMMIT_WINDOW:
+            self.Save()
+        elif self.commitTimer is None:
+            self.commitTimer = wx.CallLater(int(self.COMMIT_WINDOW * 1000), self.onCommitTimer)
+
+    def onCommitTimer(self):
+        self.commitTimer = None
+        # If a batch is in progress, its end will schedule the commit.
+        if self.AutoSave and not self.BatchDepth:
+            self.FlushPendingCommits()
+
+    def initJournal(self):
+        """
+        Use write-ahead logging, which keeps the file consistent after a crash
+        while only syncing on checkpoints with synchronous=NORMAL. Group commits
+        are rare enough to afford a full sync each, making them durable as well.
+        In-memory databases don't support WAL and have nothing to sync.
+        """
+        mode = self.dbconn.execute("PRAGMA journal_mode=WAL;").fetchone()[0]
+        if mode.lower() != "wal":
+            self.dbconn.execute("PRAGMA synchronous=OFF;")
+        elif self.GroupCommit:
+            self.dbconn.execute("PRAGMA synchronous=FULL;")
+        else:
+            self.dbconn.execute("PRAGMA synchronous=NORMAL;")
+
     def initialize(self):
-        cursor = self.dbconn.cursor()
+        cursor = self.cursor()
 
         cursor.execute('CREATE TABLE accounts (id INTEGER PRIMARY KEY, name VARCHAR(255), currency INTEGER)')
         cursor.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY, accountId INTEGER, amount FLOAT, description VARCHAR(255), date CHAR(10))')
@@ -217,7 +452,7 @@ class PersistentStore:
 
     def getMeta(self):
         try:
-            results = self.dbconn.cursor().execute('SELECT * FROM meta').fetchall()
+            results = self.cursor().execute('SELECT * FROM meta').fetchall()
         except sqlite3.OperationalError:
             meta = {'VERSION': 1}
         else:
@@ -233,6 +468,8 @@ class PersistentStore:
 
     def upgradeDb(self, fromVer, backup=True):
         if backup:
+            # Fold any committed changes still in the write-ahead log into the file, so the copy has them.
+            self.dbconn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
             # Make a backup
             source = self.Path
             dest = self.Path + ".backup-v%i-%s" % (fromVer, datetime.date.today().strftime("%Y-%m-%d"))
@@ -245,7 +482,7 @@ class PersistentStore:
                 raise Exception("Unable to make backup before proceeding with database upgrade...bailing.")
 
         debug.debug('Upgrading db from %i' % fromVer)
-        cursor = self.dbconn.cursor()
+        cursor = self.cursor()
 
         if fromVer == 1:
             # Add `currency` column to the accounts table with default value 0.
@@ -299,16 +536,82 @@ class PersistentStore:
         elif fromVer == 12:
             # globalCurrency entry
             cursor.execute('INSERT INTO meta VALUES (null, ?, ?)', ('GlobalCurrency', 0))
+        elif fromVer == 13:
+            # Indexes for date ranges within an account, transfer links and recurring children.
+            # (accountId, date) also serves plain accountId look-ups, so the old index is redundant.
+            cursor.execute('CREATE INDEX IF NOT EXISTS transactions_accountId_date_idx ON transactions(accountId, date)')
+            cursor.execute('DROP INDEX IF EXISTS transactions_accountId_idx')
+            cursor.execute('CREATE INDEX IF NOT EXISTS transactions_linkId_idx ON transactions(linkId)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS transactions_recurringParent_idx ON transactions(recurringParent)')
+            # Give the query planner statistics to choose between them.
+            cursor.execute('ANALYZE')
+        elif fromVer == 14:
+            # Store transaction dates as day ordinals (see datetime.date.toordinal) instead of strings,
+            # so they load without parsing and date ranges are integer comparisons.
+            cursor.execute('ALTER TABLE transactions RENAME TO transactions_v14')
+            cursor.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY, accountId INTEGER, amount FLOAT, description VARCHAR(255), date INTEGER, linkId INTEGER, recurringParent INTEGER)')
+            # Older rows have both "YYYY/MM/DD" and "YYYY-MM-DD" dates, which _MassageDate handles.
+            rows = self.cursor().execute('SELECT * FROM transactions_v14')
+            cursor.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((tId, aId, amount, desc, Transaction._MassageDate(date).toordinal(), linkId, rId) for tId, aId, amount, desc, date, linkId, rId in rows))
+            # Dropping the old table drops its indexes, so they can be created again for the new one.
+            cursor.execute('DROP TABLE transactions_v14')
+            cursor.execute('CREATE INDEX transactions_accountId_date_idx ON transactions(accountId, date)')
+            cursor.execute('CREATE INDEX transactions_linkId_idx ON transactions(linkId)')
+            cursor.execute('CREATE INDEX transactions_recurringParent_idx ON transactions(recurringParent)')
+            cursor.execute('ANALYZE')
+        elif fromVer == 15:
+            # Store transaction amounts and account balances as integer units (see currencies.AMOUNT_DIGITS)
+            # instead of floats, so sums are exact. The FLOAT columns would turn integers back into floats,
+            # so the tables are rebuilt with INTEGER columns.
+            cursor.execute('ALTER TABLE transactions RENAME TO transactions_v15')
+            cursor.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY, accountId INTEGER, amount INTEGER, description VARCHAR(255), date INTEGER, linkId INTEGER, recurringParent INTEGER)')
+            rows = self.cursor().execute('SELECT * FROM transactions_v15')
+            cursor.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((tId, aId, amount2units(amount or 0), desc, date, linkId, rId) for tId, aId, amount, desc, date, linkId, rId in rows))
+            cursor.execute('DROP TABLE transactions_v15')
+            cursor.execute('CREATE INDEX transactions_accountId_date_idx ON transactions(accountId, date)')
+            cursor.execute('CREATE INDEX transactions_linkId_idx ON transactions(linkId)')
+            cursor.execute('CREATE INDEX transactions_recurringParent_idx ON transactions(recurringParent)')
+
+            cursor.execute('ALTER TABLE accounts RENAME TO accounts_v15')
+            cursor.execute('CREATE TABLE accounts (id INTEGER PRIMARY KEY, name VARCHAR(255), currency INTEGER not null DEFAULT 0, balance INTEGER not null DEFAULT 0, mintId INTEGER)')
+            rows = self.cursor().execute('SELECT * FROM accounts_v15')
+            cursor.executemany('INSERT INTO accounts VALUES (?, ?, ?, ?, ?)',
+                ((aId, name, currency, amount2units(balance or 0), mintId) for aId, name, currency, balance, mintId in rows))
+            cursor.execute('DROP TABLE accounts_v15')
+            cursor.execute('ANALYZE')
+        elif fromVer == 16:
+            # Tagging infrastructure, so tags needn't be parsed out of every description on load.
+            cursor.execute('CREATE TABLE tags (id INTEGER PRIMARY KEY, name VARCHAR(255))')
+            cursor.execute('CREATE UNIQUE INDEX tags_name_idx ON tags(name)')
+            cursor.execute('CREATE TABLE transactions_tags_link (id INTEGER PRIMARY KEY, transactionId INTEGER, tagId INTEGER)')
+            cursor.execute('CREATE INDEX transactions_tags_transactionId_idx ON transactions_tags_link(transactionId)')
+            cursor.execute('CREATE INDEX transactions_tags_tagId_idx ON transactions_tags_link(tagId)')
+            # Parse the existing descriptions this one last time.
+            for tId, description in self.cursor().execute('SELECT id, description FROM transactions').fetchall():
+                for tag in Transaction.ParseTags(unicode(description)):
+                    cursor.execute('INSERT INTO transactions_tags_link VALUES (null, ?, ?)', (tId, self.getTagId(tag)))
+        elif fromVer == 17:
+            # A full-text index of descriptions for searching, kept in sync by triggers.
+            # Not every SQLite has FTS4 (or its unicode61 tokenizer); without it, searches use regular expressions.
+            for options in (", tokenize=unicode61", ""):
+                try:
+                    cursor.execute('CREATE VIRTUAL TABLE transactions_fts USING fts4(description%s)' % options)
+                except sqlite3.OperationalError:
+                    continue
+                cursor.execute('INSERT INTO transactions_fts (docid, description) SELECT id, description FROM transactions')
+                cursor.execute('CREATE TRIGGER transactions_fts_insert AFTER INSERT ON transactions BEGIN '
+                               'INSERT INTO transactions_fts (docid, description) VALUES (new.id, new.description); END')
+                cursor.execute('CREATE TRIGGER transactions_fts_update AFTER UPDATE OF description ON transactions BEGIN '
+                               'UPDATE transactions_fts SET description=new.description WHERE docid=old.id; END')
+                cursor.execute('CREATE TRIGGER transactions_fts_delete AFTER DELETE ON transactions BEGIN '
+                               'DELETE FROM transactions_fts WHERE docid=old.id; END')
+                break
+            else:
+                debug.debug("Unable to create a full-text index, FTS4 isn't available.")
         else:
             raise Exception("Cannot upgrade database from version %i"%fromVer)
-        
-        """
-        # Tagging infrastructure (currently unused due to speed of parsing on startup).
-        cursor.execute('CREATE TABLE tags (id INTEGER PRIMARY KEY, name VARCHAR(255))')
-        cursor.execute('CREATE TABLE transactions_tags_link (id INTEGER PRIMARY KEY, transactionId INTEGER, tagId INTEGER)')
-        cursor.execute('CREATE INDEX transactions_tags_transactionId_idx ON transactions_tags_link(transactionId)')
-        cursor.execute('CREATE INDEX transactions_tags_tagId_idx ON transactions_tags_link(tagId)')
-        """
 
         metaVer = fromVer + 1
         cursor.execute('UPDATE meta SET value=? WHERE name=?', (metaVer, "VERSION"))
@@ -316,11 +619,24 @@ class PersistentStore:
 
     def syncBalances(self):
         debug.debug("Syncing balances...")
-        # Load the model, necessary to sync the balances.
-        model = self.GetModel()
-        for account in model.Accounts:
-            account.Balance = sum([t.Amount for t in account.Transactions])
-        self.commitIfAppropriate()
+        # Sum in SQL, so this doesn't need to load every account's transactions.
+        cursor = self.cursor()
+        sums = dict(cursor.execute('SELECT accountId, SUM(amount) FROM transactions GROUP BY accountId').fetchall())
+        balances, changed = {}, False
+        for accountId, balance in cursor.execute('SELECT id, balance FROM accounts').fetchall():
+            balances[accountId] = sums.get(accountId, 0)
+            if balance != balances[accountId]:
+                cursor.execute('UPDATE accounts SET balance=? WHERE id=?', (balances[accountId], accountId))
+                changed = True
+
+        # Any loaded accounts should agree; they've been stored already so set them quietly.
+        if self.cachedModel is not None:
+            for account in self.cachedModel.Accounts:
+                account.IsFrozen = True
+                account.Balance = units2amount(balances.get(account.ID, 0))
+                account.IsFrozen = False
+        if changed:
+            self.commitIfAppropriate()
             
     def recurringtransaction2result(self, recurringObj):
         """
@@ -338,43 +654,37 @@ class PersistentStore:
 
     def result2account(self, result):
         ID, name, currency, balance, mintId = result
-        return Account(self, ID, name, currency, balance, mintId)
+        return Account(self, ID, name, currency, units2amount(balance or 0), mintId)
     
-    def result2recurringtransaction(self, result, parentAccount, allAccounts):
+    def result2recurringtransaction(self, result, parentAccount, accountsById):
         rId, accountId, amount, description, date, repeatType, repeatEvery, repeatOn, endDate, sourceId, lastTransacted = result
         
         if repeatOn:
             repeatOn = [int(x) for x in repeatOn.split(",")]
 
-        if sourceId:
-            try:
-                sourceAccount = [a for a in allAccounts if a.ID == sourceId][0]
-            except IndexError:
-                # The sourceAccount no longer exists; it was likely deleted.
-                sourceAccount = None
-        else:
-            sourceAccount = None
+        # If the sourceAccount no longer exists, it was likely deleted.
+        sourceAccount = accountsById.get(sourceId)
 
         return RecurringTransaction(rId, parentAccount, amount, description, date, repeatType, repeatEvery, repeatOn, endDate, sourceAccount, lastTransacted)
 
     def getAccountRows(self):
-        return self.dbconn.cursor().execute("SELECT * FROM accounts").fetchall()
+        return self.cursor().execute("SELECT * FROM accounts").fetchall()
         
     def GetAccounts(self):
         # Fetch all the accounts.
         accounts = [self.result2account(result) for result in self.getAccountRows()]
+        accountsById = dict((account.ID, account) for account in accounts)
         # Add any recurring transactions that exist for each.
         recurrings = self.getRecurringTransactions()
         for recurring in recurrings:
-            parentId = recurring[1]
-            for account in accounts:
-                if account.ID == parentId:
-                    rObj = self.result2recurringtransaction(recurring, account, accounts)
-                    account.RecurringTransactions.append(rObj)
+            account = accountsById.get(recurring[1])
+            if account is not None:
+                rObj = self.result2recurringtransaction(recurring, account, accountsById)
+                account.RecurringTransactions.append(rObj)
         return accounts
     
     def getRecurringTransactions(self):
-        return self.dbconn.cursor().execute('SELECT * FROM recurring_transactions').fetchall()
+        return self.cursor().execute('SELECT * FROM recurring_transactions').fetchall()
         
     def cleanOrphanedTransactions(self):
         # Grab all the accounts that currently exist, to check against.
@@ -383,7 +693,7 @@ class PersistentStore:
         deceasedAccounts = set()
         
         # Iterate over the transactions, treating the cursor as an iterator instead of fetchall() in case there are a lot.
-        for transactionRow in self.dbconn.cursor().execute('SELECT * FROM transactions'):
+        for transactionRow in self.cursor().execute('SELECT * FROM transactions'):
             accountID = transactionRow[1]
             # If the account ID isn't in the current accounts, it must not exist and this transaction is an orphan, so note the parent.
             if accountID not in accountIDs:
@@ -391,86 +701,126 @@ class PersistentStore:
                 
         # Now iterate over the deceased accounts of which to remove orphans.
         for accountID in deceasedAccounts:
-            self.dbconn.cursor().execute('DELETE FROM transactions WHERE accountId=?', (accountID,))
+            self.cursor().execute('DELETE FROM transactions WHERE accountId=?', (accountID,))
         
         self.commitIfAppropriate()        
 
-    def result2transaction(self, result, parentObj, linkedTransaction=None, recurringCache=None):
+    def result2transaction(self, result, parentObj, recurringCache, tagCache):
         tid, pid, amount, description, date, linkId, recurringId = result
-        t = Transaction(tid, parentObj, amount, description, date)
-
-        # Handle a linked transaction being passed in, a special case called from a few lines down.
-        if linkedTransaction:
-            t.LinkedTransaction = linkedTransaction
-        else:
-            # Handle recurring parents.
-            if recurringId:
-                t.RecurringParent = recurringCache[recurringId]
+        t = Transaction(tid, parentObj, units2amount(amount), description, datetime.date.fromordinal(date), tagCache.get(tid, NO_TAGS))
 
-            # Handle linked transactions.
-            if linkId:
-                try:
-                    link, linkAccount = self.getTransactionAndParentById(linkId, parentObj, t)
-                except MissingLinkException:
-                    # The link is gone, it's Account was likely deleted before LP: #514183/605591 was fixed. Remove it.
-                    t.LinkedTransaction = None
-                else:
-                    # If the link parent hasn't loaded its transactions yet, put this in its pre list so this
-                    # object is used if and when they are loaded.
-                    if linkAccount._Transactions is None:
-                        linkAccount._preTransactions.append(link)
-                    t.LinkedTransaction = link
-                    # Synchronize the RecurringParent attribute.
-                    t.LinkedTransaction.RecurringParent = t.RecurringParent
+        # Handle recurring parents, quietly since this is what is already stored.
+        if recurringId:
+            t.IsFrozen = True
+            t.RecurringParent = recurringCache[recurringId]
+            t.IsFrozen = False
         return t
 
-    def getTransactionsFrom(self, account):
-        transactions = TransactionList()
+    def LoadTransactions(self, accounts):
+        """
+        Load the transactions of the accounts in a single pass over the transactions table,
+        such as just the one being viewed or every one for "All accounts".
+        Links and recurring parents are resolved from ID maps rather than a query per link,
+        and the other sides of transfers in accounts not being loaded are read in one more
+        query and kept pending in their accounts, so loading those later uses the same objects.
+
+        The transactions are built quietly, and then a single "transactions.loaded"
+        message is sent with the loaded accounts and how many of their transactions
+        have each tag name.
+        """
+        accountList = accounts[0].Parent
+        # An account may have just been removed from the list, in which case it still needs loading.
+        accountsById = dict((a.ID, a) for a in accountList)
+        accounts = dict((a.ID, a) for a in accounts)
+        accountsById.update(accounts)
+
         # Generate a map of recurring transaction IDs to the objects for fast look-up.
         recurringCache = {}
-        for recurring in account.Parent.GetRecurringTransactions():
+        for recurring in accountList.GetRecurringTransactions():
             recurringCache[recurring.ID] = recurring
-            
-        Publisher.sendMessage("batch.start")
-        for result in self.dbconn.cursor().execute('SELECT * FROM transactions WHERE accountId=?', (account.ID,)).fetchall():
-            t = self.result2transaction(result, account, recurringCache=recurringCache)
-            transactions.append(t)
-        Publisher.sendMessage("batch.end")
-        return transactions
-
-    def getTransactionAndParentById(self, tId, parentObj, linked):
-        result = self.dbconn.cursor().execute('SELECT * FROM transactions WHERE id=? LIMIT 1', (tId,)).fetchone()
-        if result is None:
-            # This is probably LP #514183: the account of the sibling was deleted.
-            raise MissingLinkException("Unable to find the linked transaction")
-        
-        # Before we can create the LinkedTransaction, we need to find its parent.
-        linkedParent = None
-        for account in parentObj.Parent:
-            if account.ID == result[1]:
-                linkedParent = account
-                break
-        if linkedParent is None:
-            raise Exception("Unable to find parent of LinkedTransaction")
-        
-        transaction = self.result2transaction(result, linkedParent, linkedTransaction=linked)
-        return transaction, linkedParent
+        tagCache = self.getTransactionTags()
+
+        # Transactions which already have objects (loaded, pending or added since) must keep them, so links are
+        # the real instances. The model indexes all of those by ID; ones made here are only added to it once loaded.
+        knownById = accountList.BankModel.transactionsById
+        transactionsById = {}
+        def getTransaction(tId):
+            t = transactionsById.get(tId)
+            if t is None:
+                t = knownById.get(tId)
+            return t
+
+        transactionLists = dict((aId, []) for aId in accounts)
+        linkIds = []
+        if len(accounts) == 1:
+            rows = self.cursor().execute('SELECT * FROM transactions WHERE accountId=? ORDER BY id', accounts.keys())
+        else:
+            rows = self.cursor().execute('SELECT * FROM transactions ORDER BY id')
+        for result in rows:
+            tId, accountId, linkId = result[0], result[1], result[5]
+            if accountId not in accounts:
+                continue
+            t = getTransaction(tId)
+            if t is None:
+                t = transactionsById[tId] = self.result2transaction(result, accounts[accountId], recurringCache, tagCache)
+                if linkId:
+                    linkIds.append((t, linkId))
+            transactionLists[accountId].append(t)
+
+        # Read the other sides of transfers which aren't loaded yet, leaving them pending in their accounts.
+        missingIds = list(set(linkId for t, linkId in linkIds if getTransaction(linkId) is None))
+        cursor = self.cursor()
+        for i in range(0, len(missingIds), self.SQL_VARIABLE_LIMIT):
+            chunk = missingIds[i:i+self.SQL_VARIABLE_LIMIT]
+            for result in cursor.execute('SELECT * FROM transactions WHERE id IN (%s)' % ",".join("?" * len(chunk)), chunk).fetchall():
+                other = accountsById.get(result[1])
+                if other is not None:
+                    link = transactionsById[result[0]] = self.result2transaction(result, other, recurringCache, tagCache)
+                    # Index it like a transaction added to the unloaded account, which it now is.
+                    other._pendingTransactions[link.ID] = knownById[link.ID] = link
+                    linkIds.append((link, result[5]))
+
+        brokenLinks = []
+        for t, linkId in linkIds:
+            link = getTransaction(linkId)
+            if link is None:
+                brokenLinks.append(t)
+            else:
+                t.IsFrozen = True
+                t.LinkedTransaction = link
+                t.IsFrozen = False
+        # Only removing broken links needs writing.
+        if brokenLinks:
+            Publisher.sendMessage("batch.start")
+            for t in brokenLinks:
+                # The link is gone, its Account was likely deleted before LP: #514183/605591 was fixed. Remove it.
+                t.LinkedTransaction = None
+            Publisher.sendMessage("batch.end")
+
+        tagCounts = {}
+        for aId, other in accounts.items():
+            other._Transactions = TransactionList(transactionLists[aId])
+            other._pendingTransactions = {}
+            for t in other._Transactions:
+                for tag in t._Tags:
+                    tagCounts[tag.Name] = tagCounts.get(tag.Name, 0) + 1
+        Publisher.sendMessage("transactions.loaded", (accounts.values(), tagCounts))
 
     def renameAccount(self, oldName, account):
-        self.dbconn.cursor().execute("UPDATE accounts SET name=? WHERE name=?", (account.Name, oldName))
+        self.cursor().execute("UPDATE accounts SET name=? WHERE name=?", (account.Name, oldName))
         self.commitIfAppropriate()
         
     def setCurrency(self, currencyIndex, account=None):
 		if account:
-			self.dbconn.cursor().execute('UPDATE accounts SET currency=? WHERE id=?', (currencyIndex, account.ID))
+			self.cursor().execute('UPDATE accounts SET currency=? WHERE id=?', (currencyIndex, account.ID))
 		else:
 		    # Since no account received, we are updating the global currency
-		    self.dbconn.cursor().execute('UPDATE meta SET value=? WHERE name="GlobalCurrency"', (currencyIndex,))	
+		    self.cursor().execute('UPDATE meta SET value=? WHERE name="GlobalCurrency"', (currencyIndex,))	
 		self.commitIfAppropriate()
 
         
     def __print__(self):
-        cursor = self.dbconn.cursor()
+        cursor = self.cursor()
         for account in cursor.execute("SELECT * FROM accounts").fetchall():
             print account[1]
             for trans in cursor.execute("SELECT * FROM transactions WHERE accountId=?", (account[0],)).fetchall():
@@ -486,36 +836,19 @@ class PersistentStore:
 
     def onAccountBalanceChanged(self, message):
         account = message.data
-        self.dbconn.cursor().execute("UPDATE accounts SET balance=? WHERE id=?", (account.Balance, account.ID))
+        self.cursor().execute("UPDATE accounts SET balance=? WHERE id=?", (amount2units(account.Balance), account.ID))
         self.commitIfAppropriate()
 
     def onExit(self, message):
         self.syncBalances()
+        if self.AutoSave:
+            self.FlushPendingCommits()
         if self.Dirty:
             Publisher.sendMessage("warning.dirty exit", message.data)
             
-    def onORMObjectUpdated(self, message):
-        topic, data = message.topic, message.data
-        classname, attrname = topic[-2:]
-        ormobj = data
-        
-        table = ormobj.ORM_TABLE
-        value = ormobj.getAttrValue(attrname)
-        
-        if isinstance(ormobj, ORMKeyValueObject):
-            result = self.dbconn.cursor().execute("UPDATE %s SET value=? WHERE name=?" % table, (repr(value), attrname))
-        else:
-            # Figure out the name of the column
-            colname = attrname.strip("_")
-            colname = colname[0].lower() + colname[1:]
-            colname = {"repeatOn": "repeatsOn", "source": "sourceId", "linkedTransaction": "linkId"}.get(colname, colname)
-            
-            query = "UPDATE %s SET %s=? WHERE id=?" % (table, colname)
-            objId = ormobj.ID    
-            self.dbconn.cursor().execute(query, (value, objId))
-            
+    def onORMObjectDirty(self, message):
+        self.dirtyObjects.append(message.data)
         self.commitIfAppropriate()
-        debug.debug("Persisting %s.%s update (%s)" % (classname, attrname, value))
 
     def __del__(self):
         self.commitIfAppropriate()
@@ -18,6 +18,7 @@
 
 import wx
 from wxbanker import bankcontrols
+from wxbanker.bankobjects.tag import Tag
 from wx.lib.pubsub import Publisher
 
 
@@ -44,15 +45,47 @@ class SearchCtrl(wx.Panel):
         self.matchChoices = [_("Amount"), _("Description"), _("Date")]
         self.descriptionSelection = 1
         self.matchBox = bankcontrols.CompactableComboBox(self, value=self.matchChoices[1], choices=self.matchChoices, style=wx.CB_READONLY)
+        # Description searches match words using the full-text index unless this is checked.
+        self.regexCheck = wx.CheckBox(self, label=_("Regular expression"))
+
+        # The structured query options, see BankModel.Query. Filling any of them in searches by them instead.
+        self.amountLowCtrl = wx.TextCtrl(self, size=(70, -1))
+        self.amountHighCtrl = wx.TextCtrl(self, size=(70, -1))
+        self.dateLowCtrl = wx.TextCtrl(self, size=(90, -1))
+        self.dateHighCtrl = wx.TextCtrl(self, size=(90, -1))
+        for ctrl in (self.dateLowCtrl, self.dateHighCtrl):
+            ctrl.SetToolTipString(_("A date, month or year, such as 2010-03-15, 2010-03 or 2010"))
+        self.tagsCtrl = wx.TextCtrl(self, size=(100, -1))
+        self.tagsCtrl.SetToolTipString(_("Tags which the transactions must all have, such as #rent #utilities"))
+        self.allAccountsCheck = wx.CheckBox(self, label=_("All accounts"))
+        self.queryCtrls = (self.amountLowCtrl, self.amountHighCtrl, self.dateLowCtrl, self.dateHighCtrl, self.tagsCtrl)
 
         topSizer = wx.BoxSizer()
         topSizer.Add(self.searchCtrl, 0, wx.ALIGN_CENTER_VERTICAL)
         topSizer.AddSpacer(10)
         topSizer.Add(self.moreButton, 0, wx.ALIGN_CENTER_VERTICAL)
 
-        self.moreSizer = moreSizer = wx.BoxSizer()
-        moreSizer.Add(wx.StaticText(self, label=_("Match: ")), 0, wx.ALIGN_CENTER_VERTICAL)
-        moreSizer.Add(self.matchBox, 0, wx.ALIGN_CENTER_VERTICAL)
+        matchSizer = wx.BoxSizer()
+        matchSizer.Add(wx.StaticText(self, label=_("Match: ")), 0, wx.ALIGN_CENTER_VERTICAL)
+        matchSizer.Add(self.matchBox, 0, wx.ALIGN_CENTER_VERTICAL)
+        matchSizer.AddSpacer(10)
+        matchSizer.Add(self.regexCheck, 0, wx.ALIGN_CENTER_VERTICAL)
+
+        querySizer = wx.BoxSizer()
+        for label, low, high in ((_("Amount: "), self.amountLowCtrl, self.amountHighCtrl), (_("Date: "), self.dateLowCtrl, self.dateHighCtrl)):
+            querySizer.Add(wx.StaticText(self, label=label), 0, wx.ALIGN_CENTER_VERTICAL)
+            querySizer.Add(low, 0, wx.ALIGN_CENTER_VERTICAL)
+            querySizer.Add(wx.StaticText(self, label=_(" to ")), 0, wx.ALIGN_CENTER_VERTICAL)
+            querySizer.Add(high, 0, wx.ALIGN_CENTER_VERTICAL)
+            querySizer.AddSpacer(10)
+        querySizer.Add(wx.StaticText(self, label=_("Tags: ")), 0, wx.ALIGN_CENTER_VERTICAL)
+        querySizer.Add(self.tagsCtrl, 0, wx.ALIGN_CENTER_VERTICAL)
+        querySizer.AddSpacer(10)
+        querySizer.Add(self.allAccountsCheck, 0, wx.ALIGN_CENTER_VERTICAL)
+
+        self.moreSizer = moreSizer = wx.BoxSizer(wx.VERTICAL)
+        moreSizer.Add(matchSizer, 0, wx.ALIGN_RIGHT)
+        moreSizer.Add(querySizer, 0, wx.ALIGN_RIGHT|wx.TOP, 2)
 
         self.Sizer = wx.BoxSizer(wx.VERTICAL)
         self.Sizer.Add(topSizer, 0, wx.ALIGN_RIGHT|wx.TOP|wx.BOTTOM, 2)
@@ -66,13 +99,18 @@ class SearchCtrl(wx.Panel):
         self.searchCtrl.Bind(wx.EVT_TEXT_ENTER, self.onSearch)
         self.moreButton.Bind(wx.EVT_BUTTON, self.onToggleMore)
         # Bindings to search on settings change automatically.
-        self.matchBox.Bind(wx.EVT_COMBOBOX, self.onSearchTrigger)
+        self.matchBox.Bind(wx.EVT_COMBOBOX, self.onMatchChanged)
+        self.regexCheck.Bind(wx.EVT_CHECKBOX, self.onSearchTrigger)
+        for ctrl in self.queryCtrls:
+            ctrl.Bind(wx.EVT_TEXT, self.onText)
+        self.allAccountsCheck.Bind(wx.EVT_CHECKBOX, self.onSearchTrigger)
         self.Bind(wx.EVT_TIMER, self.onSearchTimer)
         
         Publisher.subscribe(self.onExternalSearch, "SEARCH.EXTERNAL")
 
         # Initially hide the extra search options.
         self.onToggleMore()
+        self.updateSearchTip()
         
     def onText(self, event):
         self.SearchTimer.Start(500, wx.TIMER_ONE_SHOT)
@@ -80,6 +118,21 @@ class SearchCtrl(wx.Panel):
     def onSearchTimer(self, event):
         self.onSearch()
 
+    def onMatchChanged(self, event):
+        self.updateSearchTip()
+        self.onSearchTrigger(event)
+
+    def updateSearchTip(self):
+        # Amounts and dates can be searched by range, so show how.
+        matchType = self.matchChoices.index(self.matchBox.Value)
+        if matchType == 0:
+            tip = _("Search amounts, or a range such as 100..500")
+        elif matchType == 2:
+            tip = _("Search dates, or a period such as 2010-03 or 2010-01-15..2010-02")
+        else:
+            tip = _("Search descriptions")
+        self.searchCtrl.SetToolTipString(tip)
+
     def onSearchTrigger(self, event):
         event.Skip()
         self.onSearch()
@@ -90,12 +143,37 @@ class SearchCtrl(wx.Panel):
         searchString = self.searchCtrl.Value # For a date, should be YYYY-MM-DD.
         matchType = self.matchChoices.index(self.matchBox.Value)
 
-        searchInfo = (searchString, matchType)
+        searchInfo = (searchString, matchType, self.regexCheck.Value)
+        query = self.GetQuery()
+        if query is not None:
+            Publisher.sendMessage("SEARCH.QUERY", query)
         # Consider a blank search as a search cancellation.
-        if searchString == "":
+        elif searchString == "":
             self.onCancel()
         else:
             Publisher.sendMessage("SEARCH.INITIATED", searchInfo)
+
+    def GetQuery(self):
+        """
+        Return the BankModel.Query arguments of the query options as a dict, or None if they are blank.
+        A bound which isn't an amount or date (yet, while typing) is left open.
+        """
+        model = self.bankController.Model
+        ranges = []
+        for matchIndex, low, high in ((0, self.amountLowCtrl, self.amountHighCtrl), (2, self.dateLowCtrl, self.dateHighCtrl)):
+            bounds = None
+            try:
+                bounds = model.ParseBounds(low.Value, high.Value, matchIndex)
+            except ValueError:
+                pass
+            if bounds == (None, None):
+                bounds = None
+            ranges.append(bounds)
+        tags = [Tag(name.lower()) for name in self.tagsCtrl.Value.replace(Tag.TAG_CHAR, " ").split()]
+
+        if ranges == [None, None] and not tags:
+            return None
+        return {"amountRange": ranges[0], "dateRange": ranges[1], "tags": tags, "allAccounts": self.allAccountsCheck.Value}
             
     def onExternalSearch(self, message):
         # If something else performs a search (such as Tag context menu), update the Value and search.
@@ -22,7 +22,7 @@ from wxbanker.tests import testbase, xmlrunner
 import unittest, os, sys
 
 # Find the modules to test.
-ignores = ('__init__.py', 'testbase.py', 'alltests.py', 'xmlrunner.py')
+ignores = ('__init__.py', 'testbase.py', 'alltests.py', 'xmlrunner.py', 'benchmarks.py')
 files = [f for f in os.listdir(testbase.testdir) if f.endswith(".py") and f not in ignores]
 modules = [m.replace(".py", "") for m in files]
 
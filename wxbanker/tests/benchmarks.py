@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#    https://launchpad.net/wxbanker
+#    benchmarks.py: Copyright 2007-2010 Mike Rooney <mrooney@ubuntu.com>
+#
+#    This file is part of wxBanker.
+#
+#    wxBanker is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    wxBanker is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with wxBanker.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Timings of the model and store, for comparing implementations. These aren't
+part of alltests; run them all or just some by name:
+
+    python -m wxbanker.tests.benchmarks [alltransactions|amounts|commits|fields|import|load|memory|messages|search|sorts|totals|typeahead|xtotals ...]
+"""
+
+from wxbanker.tests import testbase
+from wxbanker.tests.testbase import removeDb
+import os, sys, tempfile, time, datetime
+import wx
+from wx.lib.pubsub import Publisher
+from wxbanker.persistentstore import PersistentStore
+from wxbanker.bankobjects.transaction import Transaction
+from wxbanker.bankobjects.searchsession import SearchSession
+from wxbanker.analyzers import MonthlyAnalyzer
+from wxbanker.currencies import CurrencyList, amount2units, units2amount
+from wxbanker.currconvert import CurrencyConverter
+
+
+def report(name, seconds, count, unit):
+    print "  %-36s %8.3fs %12.0f %s/s" % (name, seconds, count / seconds, unit)
+
+def makeDbPath():
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    os.remove(path)
+    return path
+
+def makeStore(path, legacy=False, groupCommit=False):
+    Publisher.unsubAll()
+    store = PersistentStore(path, groupCommit=groupCommit)
+    if legacy:
+        # The settings before WAL: a rollback journal and no syncing at all.
+        store.dbconn.execute("PRAGMA journal_mode=DELETE;")
+        store.dbconn.execute("PRAGMA synchronous=OFF;")
+    return store
+
+
+def benchmarkCommits(count=2000):
+    """Auto-saved amount edits per second, each being a transaction and balance UPDATE."""
+    print "Commit throughput, %i amount edits:" % count
+    for name, kwargs in (
+        ("legacy (synchronous=OFF)", {"legacy": True}),
+        ("WAL, commit per write", {}),
+        ("WAL, group commit", {"groupCommit": True}),
+    ):
+        path = makeDbPath()
+        store = makeStore(path, **kwargs)
+        account = store.GetModel().CreateAccount("A")
+        transaction = account.AddTransaction(1)
+
+        start = time.time()
+        for i in range(count):
+            transaction.Amount = i
+        store.FlushPendingCommits()
+        report(name, time.time() - start, count, "edits")
+
+        store.Close()
+        removeDb(path)
+
+
+def benchmarkAllTransactions(count=60000, repeats=5):
+    """The "All accounts" view's transactions, sorted all together versus merged per account."""
+    print "All transactions of %i in three accounts:" % count
+    path = makeDbPath()
+    store = makeStore(path)
+    model = store.GetModel()
+    for i in range(3):
+        account = model.CreateAccount("Account %i" % i)
+        store.MakeTransactions(account, makeImportRows(count / 3))
+    model.GetTransactions()
+
+    def concatenateAndSort():
+        transactions = []
+        for account in model.Accounts:
+            transactions.extend(account.Transactions)
+        return sorted(transactions)
+
+    for name, operation in (
+        ("concatenate and sort", concatenateAndSort),
+        ("k-way merge", lambda: list(model.IterTransactions())),
+        ("cached snapshot", model.GetTransactions),
+    ):
+        start = time.time()
+        for i in range(repeats):
+            operation()
+        report(name, time.time() - start, repeats, "views")
+
+    store.Close()
+    removeDb(path)
+
+
+def benchmarkFields(count=100000):
+    """Making transactions, and editing persisted fields within a batch, as the store queues them."""
+    print "Fields of %i transactions:" % count
+    path = makeDbPath()
+    store = makeStore(path)
+    account = store.GetModel().CreateAccount("A")
+    store.MakeTransactions(account, makeImportRows(count))
+
+    start = time.time()
+    makeImportRows(count)
+    report("constructing", time.time() - start, count, "transactions")
+
+    transactions = account.Transactions
+    start = time.time()
+    Publisher.sendMessage("batch.start")
+    for t in transactions:
+        t.Amount = 1
+        t.Description = "Edited"
+    Publisher.sendMessage("batch.end")
+    report("amount and description edits", time.time() - start, count * 2, "edits")
+
+    store.Close()
+    removeDb(path)
+
+
+def makeImportRows(count):
+    return [Transaction(None, None, i % 100 - 50, "Row %i" % i, "2010/01/%02i" % (i % 28 + 1)) for i in range(count)]
+
+def benchmarkImport(counts=(5000, 20000)):
+    """Importing rows into an account one AddTransaction at a time versus with AddTransactions."""
+    print "Importing transactions:"
+    for count in counts:
+        for name, bulk in (("AddTransaction per row", False), ("AddTransactions", True)):
+            path = makeDbPath()
+            store = makeStore(path)
+            account = store.GetModel().CreateAccount("A")
+            rows = makeImportRows(count)
+
+            start = time.time()
+            if bulk:
+                account.AddTransactions(rows)
+            else:
+                Publisher.sendMessage("batch.start")
+                for row in rows:
+                    account.AddTransaction(transaction=row)
+                Publisher.sendMessage("batch.end")
+            report("%s, %i rows" % (name, count), time.time() - start, count, "rows")
+
+            store.Close()
+            removeDb(path)
+
+
+def benchmarkLoad(count=100000):
+    """Loading an account from disk, and the date decoding that used to dominate it."""
+    print "Loading %i transactions:" % count
+    path = makeDbPath()
+    store = makeStore(path)
+    account = store.GetModel().CreateAccount("A")
+    store.MakeTransactions(account, makeImportRows(count))
+    store.Close()
+
+    store = makeStore(path)
+    start = time.time()
+    store.GetModel().Accounts[0].Transactions
+    report("model load", time.time() - start, count, "rows")
+    store.Close()
+    removeDb(path)
+
+    # Compare decoding the stored values, as strings before schema v15 and as ordinals now.
+    strings = ["2010/01/%02i" % (i % 28 + 1) for i in range(count)]
+    ordinals = [Transaction._MassageDate(s).toordinal() for s in strings]
+    for name, decode, values in (
+        ("decode YYYY/MM/DD strings", Transaction._MassageDate, strings),
+        ("decode day ordinals", lambda o: Transaction._MassageDate(datetime.date.fromordinal(o)), ordinals),
+    ):
+        start = time.time()
+        for value in values:
+            decode(value)
+        report(name, time.time() - start, count, "dates")
+
+
+class DictTransaction(object):
+    """What a transaction used to hold: a __dict__, its own tag set, description and date."""
+
+def transactionSize(transaction, seen):
+    """The bytes of a transaction and of the values it holds that aren't already in `seen`."""
+    values = [transaction]
+    if hasattr(transaction, "__dict__"):
+        values.append(transaction.__dict__)
+    for attr in ("_Date", "_Description", "_Tags", "_Amount", "PreviousDate", "PreviousAmount"):
+        values.append(getattr(transaction, attr, None))
+    size = 0
+    for value in values:
+        if id(value) not in seen:
+            seen.add(id(value))
+            size += sys.getsizeof(value)
+    return size
+
+def benchmarkMemory(count=100000):
+    """Bytes per loaded transaction, with a __dict__ and unshared values as before and as now."""
+    print "Memory of %i loaded transactions:" % count
+    path = makeDbPath()
+    store = makeStore(path)
+    account = store.GetModel().CreateAccount("A")
+    descriptions = [u"Groceries", u"Rent", u"Coffee", u"Paycheck", u"Gas"]
+    rows = [Transaction(None, None, i % 100 - 50, descriptions[i % 5], "2010/01/%02i" % (i % 28 + 1)) for i in range(count)]
+    store.MakeTransactions(account, rows)
+    store.Close()
+
+    store = makeStore(path)
+    transactions = store.GetModel().Accounts[0].Transactions
+    before = []
+    for t in transactions:
+        d = DictTransaction()
+        # Each row used to decode its own description, date and amount, and have its own tag set.
+        d.__dict__.update(ID=t.ID, IsFrozen=False, Parent=t.Parent, RecurringParent=None, _LinkedTransaction=None,
+            _Date=datetime.date.fromordinal(t._Date.toordinal()), _Description=t._Description.encode("utf-8").decode("utf-8"),
+            _Tags=set(), _Amount=float(repr(t._Amount)), PreviousDate=None, PreviousAmount=None)
+        before.append(d)
+
+    for name, objects in (("__dict__ per transaction", before), ("slots and shared values", transactions)):
+        seen = set()
+        size = sum(transactionSize(t, seen) for t in objects)
+        print "  %-36s %12.0f bytes/transaction" % (name, float(size) / count)
+
+    store.Close()
+    removeDb(path)
+
+
+def benchmarkMessages(count=100000):
+    """Pubsub messages sent while making, importing and loading transactions."""
+    print "Messages for %i transactions:" % count
+    path = makeDbPath()
+    store = makeStore(path)
+    account = store.GetModel().CreateAccount("A")
+    store.Close()
+
+    def countMessages(name, operation):
+        messages = [0]
+        def listener(message):
+            messages[0] += 1
+        Publisher.subscribe(listener)
+        start = time.time()
+        result = operation()
+        seconds = time.time() - start
+        Publisher.unsubscribe(listener)
+        print "  %-36s %8.3fs %12i messages" % (name, seconds, messages[0])
+        return result
+
+    store = makeStore(path)
+    account = store.GetModel().Accounts[0]
+    rows = countMessages("making transactions", lambda: makeImportRows(count))
+    countMessages("importing them", lambda: account.AddTransactions(rows))
+    store.Close()
+
+    store = makeStore(path)
+    countMessages("loading them", lambda: store.GetModel().Accounts[0].Transactions)
+    store.Close()
+    removeDb(path)
+
+    # A daily recurring transfer which hasn't been performed for a few years.
+    store = makeStore(path)
+    model = store.GetModel()
+    a, b = model.CreateAccount("A"), model.CreateAccount("B")
+    recurring = a.AddRecurringTransaction(1, "Daily", datetime.date.today() - datetime.timedelta(days=1999), 0, source=b)
+    countMessages("performing 2000 recurring transfers", recurring.PerformTransactions)
+    store.Close()
+    removeDb(path)
+
+
+def benchmarkAmounts(count=100000):
+    """Running totals as floats versus integer units, and how far the floats drift."""
+    print "Running totals over %i amounts:" % count
+    amounts = [(i % 1000 - 500) / 100.0 for i in range(count)]
+
+    start = time.time()
+    total, floatTotals = 0.0, []
+    for amount in amounts:
+        total += amount
+        floatTotals.append(total)
+    report("float running totals", time.time() - start, count, "amounts")
+
+    start = time.time()
+    total, unitTotals = 0, []
+    for amount in amounts:
+        total += amount2units(amount)
+        unitTotals.append(units2amount(total))
+    report("integer unit running totals", time.time() - start, count, "amounts")
+
+    drift = max(abs(f - u) for f, u in zip(floatTotals, unitTotals))
+    print "  largest float drift: %g" % drift
+
+
+def benchmarkSearch(count=100000, searches=20):
+    """Description searches through the full-text index versus regular expressions."""
+    print "Searching %i descriptions:" % count
+    path = makeDbPath()
+    store = makeStore(path)
+    model = store.GetModel()
+    account = model.CreateAccount("A")
+    store.MakeTransactions(account, makeImportRows(count))
+    account.Transactions
+
+    for name, regex in (("full-text index", False), ("regular expression", True)):
+        start = time.time()
+        for i in range(searches):
+            model.Search("Row %i" % (i * 997), regex=regex)
+        report(name, time.time() - start, searches, "searches")
+
+    store.Close()
+    removeDb(path)
+
+
+def benchmarkSorts(count=50000):
+    """Transaction comparisons made by what used to sort an account's transactions each time."""
+    print "Comparisons of %i transactions:" % count
+    path = makeDbPath()
+    store = makeStore(path)
+    model = store.GetModel()
+    account = model.CreateAccount("A")
+    # Insert them out of date order, so loading them has to sort.
+    rows = makeImportRows(count)
+    rows.reverse()
+    store.MakeTransactions(account, rows)
+    loadOrder = sorted(account.Transactions, key=lambda t: t.ID)
+
+    comparisons = [0]
+    originalCmp = Transaction.__cmp__
+    def countingCmp(self, other):
+        comparisons[0] += 1
+        return originalCmp(self, other)
+    Transaction.__cmp__ = countingCmp
+    try:
+        for name, operation in (
+            ("sorting, as each of these used to", lambda: sorted(loadOrder)),
+            ("GetDateRange", model.GetDateRange),
+            ("GetXTotals", lambda: model.GetXTotals(account)),
+            ("GetCurrentBalance", account.GetCurrentBalance),
+            ("MonthlyAnalyzer.GetEarnings", lambda: MonthlyAnalyzer().GetEarnings(account.Transactions)),
+        ):
+            comparisons[0] = 0
+            start = time.time()
+            operation()
+            seconds = time.time() - start
+            print "  %-36s %8.3fs %12i comparisons" % (name, seconds, comparisons[0])
+    finally:
+        Transaction.__cmp__ = originalCmp
+
+    store.Close()
+    removeDb(path)
+
+
+def benchmarkTotals(count=50000):
+    """The running totals of TransactionOLV.updateTotals for "All accounts", over mixed currencies."""
+    print "Running totals of %i rows in the global currency:" % count
+    path = makeDbPath()
+    store = makeStore(path)
+    model = store.GetModel()
+    # US dollars, euros and pounds, converted to euros.
+    for currency in (1, 2, 3):
+        account = model.CreateAccount("Account %i" % currency)
+        account.Currency = currency
+        store.MakeTransactions(account, makeImportRows(count / 3))
+    transactions = model.GetTransactions()
+    globalCurrency = 2
+
+    def converterPerRow(t):
+        # How GetAmount converted before the shared converter.
+        src = t.Parent.GetCurrency().GetCurrencyNick()
+        dest = CurrencyList[globalCurrency]().GetCurrencyNick()
+        return CurrencyConverter().Convert(t.Amount, src, dest)
+
+    for name, getAmount in (
+        ("converter per row", converterPerRow),
+        ("shared converter", lambda t: t.GetAmount(globalCurrency)),
+    ):
+        start = time.time()
+        total = 0
+        for t in transactions:
+            total += amount2units(getAmount(t))
+            t._Total = units2amount(total)
+        report(name, time.time() - start, len(transactions), "rows")
+
+    store.Close()
+    removeDb(path)
+
+
+def benchmarkXTotals(count=20000, years=15, repeats=5):
+    """BankModel.GetXTotals for the summary, walking day by day versus with NumPy."""
+    print "Daily totals of %i transactions over %i years:" % (count, years)
+    path = makeDbPath()
+    store = makeStore(path)
+    model = store.GetModel()
+    first = datetime.date.today() - datetime.timedelta(days=365 * years)
+    for currency in (1, 2, 3):
+        account = model.CreateAccount("Account %i" % currency)
+        account.Currency = currency
+        rows = [Transaction(None, None, i % 100 - 50, "Row %i" % i, first + datetime.timedelta(days=i * 365 * years / count)) for i in range(count / 3)]
+        store.MakeTransactions(account, rows)
+    model.GlobalCurrency = 2
+    accounts = list(model.Accounts)
+
+    for name, getTotals in (("day by day", model.getXTotalsByDay), ("vectorized", model.getXTotalsVectorized)):
+        start = time.time()
+        for i in range(repeats):
+            getTotals(accounts, model.GlobalCurrency, None)
+        report(name, time.time() - start, repeats, "summaries")
+
+    store.Close()
+    removeDb(path)
+
+
+def benchmarkTypeahead(count=100000, query="Row 12345"):
+    """Typing a description search one key at a time, each searching everything or refining the last."""
+    print "Typing \"%s\" over %i descriptions:" % (query, count)
+    path = makeDbPath()
+    store = makeStore(path)
+    model = store.GetModel()
+    account = model.CreateAccount("A")
+    store.MakeTransactions(account, makeImportRows(count))
+    account.Transactions
+
+    for name, search in (("full search per key", model.Search), ("search session", SearchSession(model).Search)):
+        slowest = 0
+        start = time.time()
+        for i in range(1, len(query) + 1):
+            keyStart = time.time()
+            search(query[:i])
+            slowest = max(slowest, time.time() - keyStart)
+        report(name, time.time() - start, len(query), "keys")
+        print "    slowest key: %.1fms" % (slowest * 1000)
+
+    store.Close()
+    removeDb(path)
+
+
+BENCHMARKS = {
+    "alltransactions": benchmarkAllTransactions,
+    "amounts": benchmarkAmounts,
+    "commits": benchmarkCommits,
+    "fields": benchmarkFields,
+    "import": benchmarkImport,
+    "load": benchmarkLoad,
+    "memory": benchmarkMemory,
+    "messages": benchmarkMessages,
+    "search": benchmarkSearch,
+    "sorts": benchmarkSorts,
+    "totals": benchmarkTotals,
+    "typeahead": benchmarkTypeahead,
+    "xtotals": benchmarkXTotals,
+}
+
+def main():
+    app = wx.App(False)
+    names = [arg for arg in sys.argv[1:] if not arg.startswith("-")] or sorted(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    main()
@@ -39,5 +39,27 @@ class CurrConvertTest(unittest.TestCase):
         self.assertRaises(currconvert.ConversionException, lambda: self.CC.Convert(1, "FOO", "USD"))
         self.assertRaises(currconvert.ConversionException, lambda: self.CC.Convert(1, "USD", "BAR"))
 
+    def testConvertIndexMatchesConvert(self):
+        nicks = [currency().GetCurrencyNick() for currency in currencies.CurrencyList]
+        for i, fromNick in enumerate(nicks):
+            for j, toNick in enumerate(nicks):
+                if fromNick in self.CC.Exchanges and toNick in self.CC.Exchanges:
+                    self.assertAlmostEqual(self.CC.ConvertIndex(100, i, j), self.CC.Convert(100, fromNick, toNick))
+        self.assertEqual(self.CC.ConvertIndex(5.23, 1, 1), 5.23)
+
+    def testSharedConverterReloadsWhenRatesChange(self):
+        converter = currconvert.GetConverter()
+        self.assertTrue(currconvert.GetConverter() is converter)
+
+        interval = currconvert.RATES_CHECK_INTERVAL
+        currconvert.RATES_CHECK_INTERVAL = -1
+        try:
+            self.assertTrue(currconvert.GetConverter() is converter)
+            # Pretend the file was modified since.
+            converter.Modified -= 1
+            self.assertFalse(currconvert.GetConverter() is converter)
+        finally:
+            currconvert.RATES_CHECK_INTERVAL = interval
+
 if __name__ == "__main__":
     unittest.main()
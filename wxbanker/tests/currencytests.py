@@ -47,6 +47,16 @@ class CurrencyTest(unittest.TestCase):
         self.assertTrue(tinyNegative < 0)
         self.assertEqual(usd.float2str(tinyNegative), u'$0.00')
 
+    def testAmountUnitsFitEveryCurrency(self):
+        for currency in currencies.CurrencyList:
+            self.assertTrue(currency().LOCALECONV['frac_digits'] <= currencies.AMOUNT_DIGITS, currency)
+
+    def testSumAmountsIsExact(self):
+        self.assertNotEqual(sum([.1] * 10), 1.0)
+        self.assertEqual(currencies.sumAmounts([.1] * 10), 1.0)
+        self.assertEqual(currencies.amount2units(-12.345), -12345)
+        self.assertEqual(currencies.units2amount(-12345), -12.345)
+
     def testCurrencyLocalizes(self):
         russianLocale = testbase.LOCALES[1]
         self.assertEqual(locale.setlocale(locale.LC_ALL, russianLocale), russianLocale)
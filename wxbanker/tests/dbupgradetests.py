@@ -20,7 +20,8 @@
 
 from wxbanker.tests import testbase
 from wxbanker.controller import Controller
-import unittest, shutil, os, tempfile, datetime
+from wxbanker.bankobjects.tag import Tag
+import unittest, shutil, os, tempfile, datetime, sqlite3
 
 class DBUpgradeTest(testbase.TestCaseHandlingConfig):
     def setUp(self):
@@ -29,7 +30,7 @@ class DBUpgradeTest(testbase.TestCaseHandlingConfig):
         
     def tearDown(self):
         if self.tmpFile:
-            os.remove(self.tmpFile)
+            testbase.removeDb(self.tmpFile)
 
     def getController(self, ver):
         origpath = testbase.fixturefile("bank-%s.db"%ver)
@@ -91,7 +92,19 @@ class DBUpgradeTest(testbase.TestCaseHandlingConfig):
         
     def testUpgradeFromPre08GetsTags(self):
         # Import a db with pre-tag tags in the description, make sure they are real tags.
-        self.markTestIncomplete("TODO")
+        origpath = testbase.fixturefile("bank-0.5.db")
+        self.tmpFile = tempfile.mkstemp()[1]
+        shutil.copyfile(origpath, self.tmpFile)
+        conn = sqlite3.connect(self.tmpFile)
+        conn.execute("UPDATE transactions SET description=description || ' #Groceries' WHERE id=(SELECT MIN(id) FROM transactions)")
+        conn.commit()
+        conn.close()
+
+        model = Controller(path=self.tmpFile).Model
+        self.assertEqual(model.Tags, set([Tag("groceries")]))
+        tagged = model.Search("#groceries")
+        self.assertEqual(len(tagged), 1)
+        self.assertEqual(tagged[0].Tags, set([Tag("groceries")]))
         
 def main():
     unittest.main()
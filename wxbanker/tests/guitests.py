@@ -20,6 +20,7 @@
 
 from wxbanker.tests import testbase
 from wxbanker import main, controller
+from wxbanker.bankobjects.tag import Tag
 import os, wx, unittest
 from wx.lib.pubsub import Publisher
 
@@ -294,6 +295,27 @@ class GUITests(testbase.TestCaseHandlingConfigBase):
         # Switch to all accounts, make sure we see both matches.
         Publisher.sendMessage("user.account changed", None)
         self.assertEqual(set(self.OLV.GetObjects()), set([t2, t4]))
+
+    def testQuery(self):
+        a = self.Model.CreateAccount("A")
+        b = self.Model.CreateAccount("B")
+
+        t1 = a.AddTransaction(100, "#rent")
+        t2 = a.AddTransaction(5, "#rent")
+        t3 = b.AddTransaction(300, "#rent")
+
+        # The query options search the current account, or all of them.
+        query = {"amountRange": (50, None), "dateRange": None, "tags": [Tag("rent")], "allAccounts": False}
+        Publisher.sendMessage("user.account changed", a)
+        Publisher.sendMessage("SEARCH.QUERY", query)
+        self.assertEqual(self.OLV.GetObjects(), [t1])
+
+        query["allAccounts"] = True
+        Publisher.sendMessage("SEARCH.QUERY", query)
+        self.assertEqual(self.OLV.GetObjects(), [t1, t3])
+
+        Publisher.sendMessage("SEARCH.CANCELLED")
+        self.assertEqual(self.OLV.GetObjects(), [t1, t2])
         
 
 if __name__ == "__main__":
@@ -30,7 +30,7 @@ from wx.lib.pubsub import Publisher
 class ModelDiskTests(testbase.TestCaseWithControllerOnDisk):
     """
     These are tests which require an actual database on disk.
-    Thankfully using PRAGMA synchronous=off makes these still very quick.
+    Thankfully the write-ahead log (see PersistentStore.initJournal) keeps these quick.
     """
     def testAutoSaveDisabledSimple(self):
         self.Controller.AutoSave = False
@@ -336,7 +336,49 @@ class ModelDiskTests(testbase.TestCaseWithControllerOnDisk):
         atrans2 = a.Transactions[0]
         self.assertEqual(atrans2.Description, "Transfer from B (cats)")
         self.assertEqual(atrans2._Description, "cats")
-        
+
+    def testLoadingAnAccountLoadsItAndItsLinks(self):
+        a, b, atrans, btrans = self.createLinkedTransfers()
+        b.AddTransaction(3)
+        c = self.Model.CreateAccount("C")
+        ctrans = c.AddTransaction(2)
+
+        model2 = self.Model.Store.GetModel(useCached=False)
+        a, b, c = model2.Accounts
+        self.assertEqual(a._Transactions, None)
+
+        # Only the transfer's other side is read from B, and it is used once B loads.
+        atrans2 = a.Transactions[0]
+        self.assertEqual(b._Transactions, None)
+        self.assertEqual(c._Transactions, None)
+        btrans2 = atrans2.LinkedTransaction
+        self.assertTrue(btrans2.Parent is b)
+        self.assertTrue(btrans2.LinkedTransaction is atrans2)
+
+        self.assertEqual(len(b.Transactions), 2)
+        self.assertTrue(b.Transactions[0] is btrans2)
+        self.assertEqual(c._Transactions, None)
+
+    def testLoadingAllTransactionsLoadsEveryAccount(self):
+        a, b, atrans, btrans = self.createLinkedTransfers()
+        c = self.Model.CreateAccount("C")
+        ctrans = c.AddTransaction(2)
+
+        model2 = self.Model.Store.GetModel(useCached=False)
+        a, b, c = model2.Accounts
+        loads = []
+        LoadTransactions = model2.Store.LoadTransactions
+        model2.Store.LoadTransactions = lambda accounts: loads.append(accounts) or LoadTransactions(accounts)
+        try:
+            self.assertEqual(len(model2.GetTransactions()), 3)
+        finally:
+            model2.Store.LoadTransactions = LoadTransactions
+
+        self.assertEqual(loads, [[a, b, c]])
+        self.assertEqual(len(c._Transactions), 1)
+        self.assertTrue(a.Transactions[0].LinkedTransaction is b.Transactions[0])
+        self.assertTrue(b.Transactions[0].LinkedTransaction is a.Transactions[0])
+
     def testTransactionRecurringParentIsStored(self):
         model1 = self.Controller.Model
         a = model1.CreateAccount("A")
@@ -460,6 +502,34 @@ class ModelDiskTests(testbase.TestCaseWithControllerOnDisk):
         self.assertEqual(a2.RecurringTransactions, [])
         self.assertEqual(model2.Accounts[0].Transactions[0].RecurringParent, None)
 
-    
+    def testLoadedTransactionsAreSorted(self):
+        a = self.Model.CreateAccount("A")
+        t1 = a.AddTransaction(1, date=tomorrow)
+        t2 = a.AddTransaction(1, date=today)
+        t3 = a.AddTransaction(1, date=today)
+
+        model2 = self.Controller.LoadPath("test.db")
+        self.assertEqual([t.ID for t in model2.Accounts[0].Transactions], [t2.ID, t3.ID, t1.ID])
+
+    def testLoadingSendsOneMessage(self):
+        a = self.Model.CreateAccount("A")
+        b = self.Model.CreateAccount("B")
+        a.AddTransaction(1, "#foo #bar")
+        a.AddTransaction(1, "#foo")
+        b.AddTransaction(1, "none", source=a)
+
+        model2 = self.Controller.LoadPath("test.db")
+        messages = []
+        listener = lambda message: messages.append(message)
+        Publisher.subscribe(listener)
+        model2.GetTransactions()
+        Publisher.unsubscribe(listener)
+
+        self.assertEqual([message.topic for message in messages], [("transactions", "loaded")])
+        accounts, tagCounts = messages[0].data
+        self.assertEqual(sorted(account.Name for account in accounts), ["A", "B"])
+        self.assertEqual(tagCounts, {"foo": 2, "bar": 1})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -23,6 +23,10 @@ import os, datetime, unittest
 from wxbanker import controller, bankexceptions, currencies
 from wx.lib.pubsub import Publisher
 from wxbanker.bankobjects.account import Account
+from wxbanker.bankobjects.transaction import Transaction
+from wxbanker.bankobjects.tag import Tag
+from wxbanker.bankobjects import searchsession
+from wxbanker.bankobjects.searchsession import SearchSession
 
 from wxbanker.mint import api as mintapi
 
@@ -189,7 +193,8 @@ class ModelTests(testbase.TestCaseWithController):
         model = self.Controller.Model
 
         self.assertEqual(len(model.Accounts), 2)
-        self.assertEqual(model.GetTransactions(), [atrans, btrans])
+        # The source side of a transfer is made first, so it sorts first on the same day.
+        self.assertEqual(model.GetTransactions(), [btrans, atrans])
         self.assertEqual(model.Balance, 0)
         self.assertEqual(len(a.Transactions), 1)
         self.assertEqual(len(b.Transactions), 1)
@@ -406,6 +411,319 @@ class ModelTests(testbase.TestCaseWithController):
         self.assertEqual(model.Search(unicodeString), [])
         t = a.AddTransaction(1, description=unicodeString)
         self.assertEqual(model.Search(unicodeString), [t])
+
+    def testFullTextSearch(self):
+        model = self.Controller.Model
+        self.assertTrue(model.Store.FullTextSearch)
+        a = model.CreateAccount("A")
+        t1 = a.AddTransaction(1, description="Whole Foods groceries")
+        t2 = a.AddTransaction(1, description="Hardware store")
+
+        self.assertEqual(model.Search("groc"), [t1])
+        self.assertEqual(model.Search("WHOLE foods"), [t1])
+        self.assertEqual(model.Search("store foods"), [])
+
+        # The index follows description changes and removals.
+        t2.Description = "Garden groceries"
+        self.assertEqual(model.Search("groceries"), [t1, t2])
+        a.RemoveTransaction(t1)
+        self.assertEqual(model.Search("groceries"), [t2])
+
+    def testWordSearchMatchesTransfersAndWithinWords(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("Checking")
+        b = model.CreateAccount("Savings")
+        t1 = a.AddTransaction(1, description="Whole Foods groceries")
+        atrans, btrans = a.AddTransaction(5, "rent", source=b)
+        session = SearchSession(model)
+
+        # Transfers match by the accounts in how they are shown, not just their stored descriptions.
+        self.assertEqual(model.Search("Transfer"), [btrans, atrans])
+        self.assertEqual(model.Search("Savings"), [atrans])
+        self.assertEqual(model.Search("transfer to rent"), [btrans])
+        # Words can start within a word, like the rest of a word being typed.
+        self.assertEqual(model.Search("oods"), [t1])
+        self.assertEqual(model.Search("ole Fo"), [t1])
+        self.assertEqual(model.Search("ole Fox"), [])
+
+        # Refining the matches agrees with searching everything.
+        for first, second in (("Tr", "Transfer fr"), ("o", "oods"), ("ole", "ole Fo"), ("check", "checking r")):
+            session.Reset()
+            session.Search(first)
+            self.assertEqual(session.Search(second), model.Search(second))
+
+    def testRegexSearch(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        t1 = a.AddTransaction(1, description="Whole Foods groceries")
+        t2 = a.AddTransaction(1, description="Hardware store")
+
+        # Words match anywhere, as does a regex.
+        self.assertEqual(model.Search("ocer"), [t1])
+        self.assertEqual(model.Search("ocer", regex=True), [t1])
+        # Something which looks like a regex is searched as one.
+        self.assertEqual(model.Search("st.re"), [t2])
+        self.assertEqual(model.Search("^(whole|hard)"), [t1, t2])
+
+    def testSearchSessionRefines(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        t1 = a.AddTransaction(1, description=u"Caf\xe9 groceries")
+        t2 = a.AddTransaction(12, description="Garden centre")
+        t3 = a.AddTransaction(2, description="Groceries")
+        session = SearchSession(model)
+
+        # Record which searches refine the last one.
+        refinements = []
+        isRefinement = session.isRefinement
+        session.isRefinement = lambda search: refinements.append(isRefinement(search)) or refinements[-1]
+
+        self.assertEqual(session.Search("g"), [t1, t2, t3])
+        self.assertEqual(session.Search("gro"), [t1, t3])
+        self.assertEqual(session.Search("groceries cafe"), [t1])
+        self.assertEqual(refinements, [False, True, True])
+
+        # Broader searches, other fields and regular expressions start over.
+        refinements[:] = []
+        self.assertEqual(session.Search("gar"), [t2])
+        self.assertEqual(session.Search("1", matchIndex=0), [t1, t2])
+        self.assertEqual(session.Search("12", matchIndex=0), [t2])
+        self.assertEqual(session.Search("g.*r"), [t1, t2, t3])
+        self.assertEqual(session.Search("g.*rd"), [t2])
+        self.assertEqual(refinements, [False, False, True, False, False])
+
+        # As do changes to the transactions.
+        refinements[:] = []
+        self.assertEqual(session.Search("centre"), [t2])
+        t3.Description = "Groceries centre"
+        self.assertEqual(session.Search("centre"), [t2, t3])
+        self.assertEqual(refinements, [False, False])
+
+    def testSearchInBackgroundDropsStaleResults(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        t1 = a.AddTransaction(1, description="Cat")
+        t2 = a.AddTransaction(2, description="Dog")
+        session = SearchSession(model)
+        session.BACKGROUND_MIN = 0
+
+        class FakeResult(object):
+            def __init__(self, value, jobID):
+                self.value, self.jobID = value, jobID
+            def get(self):
+                return self.value
+            def getJobID(self):
+                return self.jobID
+
+        # Hold on to the workers instead of starting threads, to finish them by hand.
+        jobs = []
+        startWorker = searchsession.delayedresult.startWorker
+        searchsession.delayedresult.startWorker = lambda consumer, workerFn, wargs=(), jobID=None: jobs.append((consumer, workerFn, wargs, jobID))
+        try:
+            results = []
+            self.assertEqual(session.SearchInBackground(results.append, "c.t"), 1)
+            self.assertEqual(session.SearchInBackground(results.append, "d.g"), 2)
+            self.assertEqual(session.SearchInBackground(results.append, "a|o"), 3)
+            session.Cancel()
+            self.assertEqual(session.SearchInBackground(results.append, "c|d"), 5)
+        finally:
+            searchsession.delayedresult.startWorker = startWorker
+
+        self.assertEqual([job[3] for job in jobs], [1, 2, 3, 5])
+        # Finish the newest search first, then the stale ones after it.
+        for consumer, workerFn, wargs, jobID in jobs[-1:] + jobs[:-1]:
+            consumer(FakeResult(workerFn(*wargs), jobID))
+
+        self.assertEqual(results, [[t1, t2]])
+
+    def testLookupsById(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        self.assertTrue(model.Accounts.GetById(b.ID) is b)
+        self.assertEqual(model.Accounts.GetById(-1), None)
+
+        t1 = a.AddTransaction(1)
+        t2, t3 = a.AddTransaction(2, source=b)
+        self.assertTrue(model.GetTransactionById(t1.ID) is t1)
+        self.assertTrue(model.GetTransactionById(t3.ID) is t3)
+
+        # Moving gives it a new ID, and removing drops it.
+        oldId = t1.ID
+        a.MoveTransaction(t1, b)
+        self.assertEqual(model.GetTransactionById(oldId), None)
+        self.assertTrue(model.GetTransactionById(t1.ID) is t1)
+        a.RemoveTransaction(t2)
+        self.assertEqual(model.GetTransactionById(t2.ID), None)
+        model.RemoveAccount("B")
+        self.assertEqual(model.GetTransactionById(t1.ID), None)
+
+        # Another model loads and indexes its own.
+        t4 = a.AddTransaction(4)
+        model2 = model.Store.GetModel(useCached=False)
+        self.assertEqual(model2.Accounts[0]._Transactions, None)
+        other = model2.GetTransactionById(t4.ID)
+        self.assertFalse(other is t4)
+        self.assertTrue(other is model2.Accounts[0].Transactions[0])
+        self.assertTrue(model.GetTransactionById(t4.ID) is t4)
+
+    def testAmountChangesGoToTheOwningAccount(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        t = a.AddTransaction(5)
+        b.AddTransaction(7)
+
+        calls = []
+        b.onTransactionAmountChanged = calls.append
+        t.Amount = 8.25
+        self.assertEqual(calls, [])
+        self.assertEqual((a.Balance, b.Balance), (8.25, 7))
+        del b.onTransactionAmountChanged
+
+        # Both sides of a transfer are adjusted by their difference.
+        t1, t2 = a.AddTransaction(2, source=b)
+        t1.Amount = 3.1
+        self.assertEqual((a.Balance, b.Balance), (11.35, 3.9))
+
+    def testTransactionsStaySorted(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        t1 = a.AddTransaction(1, date=today)
+        t2 = a.AddTransaction(1, date=yesterday)
+        t3 = a.AddTransaction(1, date=today)
+        self.assertEqual(a.Transactions, [t2, t1, t3])
+
+        # Date changes reposition them, including the other side of a transfer.
+        t4, t5 = a.AddTransaction(1, date=tomorrow, source=b)
+        t1.Date = tomorrow
+        t4.Date = yesterday
+        self.assertEqual(a.Transactions, [t2, t4, t3, t1])
+        self.assertEqual(b.Transactions, [t5])
+
+        rows = [Transaction(None, None, 1, "", date) for date in (tomorrow, yesterday, today)]
+        a.AddTransactions(rows)
+        self.assertEqual(a.Transactions, [t2, t4, rows[1], t3, rows[2], t1, rows[0]])
+        self.assertEqual(model.GetDateRange(), (yesterday, tomorrow))
+
+    def testTransactionsAreCompact(self):
+        a = self.Controller.Model.CreateAccount("A")
+        t1 = a.AddTransaction(1, u"Groceries", today)
+        t2 = a.AddTransaction(2, u"Grocer" + u"ies", datetime.date(today.year, today.month, today.day))
+        self.assertFalse(hasattr(t1, "__dict__"))
+
+        # Equal descriptions and dates are shared, as are empty tag sets.
+        self.assertTrue(t1._Description is t2._Description)
+        self.assertTrue(t1.Date is t2.Date)
+        self.assertTrue(t1.Tags is t2.Tags)
+
+        # Tagging one doesn't tag the other, and untagging shares the empty set again.
+        t1.AddTag("food")
+        self.assertEqual(t1.Tags, set([Tag("food")]))
+        self.assertEqual(t2.Tags, set())
+        t1.RemoveTag("food")
+        self.assertTrue(t1.Tags is t2.Tags)
+
+    def testAllTransactionsAreMerged(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        t1 = a.AddTransaction(1, date=today)
+        t2 = b.AddTransaction(1, date=yesterday)
+        t3 = a.AddTransaction(1, date=tomorrow)
+        self.assertEqual(model.GetTransactions(), [t2, t1, t3])
+        self.assertEqual(list(model.IterTransactions()), [t2, t1, t3])
+
+        # The snapshot is rebuilt after adding, redating and removing transactions.
+        t4 = b.AddTransaction(1, date=today)
+        self.assertEqual(model.GetTransactions(), [t2, t1, t4, t3])
+        t2.Date = tomorrow
+        self.assertEqual(model.GetTransactions(), [t1, t4, t2, t3])
+        a.RemoveTransaction(t3)
+        self.assertEqual(model.GetTransactions(), [t1, t4, t2])
+        model.RemoveAccount("B")
+        self.assertEqual(model.GetTransactions(), [t1])
+
+    def testBalanceIndex(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        t1 = a.AddTransaction(10, date=yesterday)
+        t2 = a.AddTransaction(2.5, date=today)
+        t3 = a.AddTransaction(-1, date=yesterday)
+
+        self.assertEqual(a.GetBalanceAt(yesterday - datetime.timedelta(days=1)), 0)
+        self.assertEqual(a.GetBalanceAt(yesterday), 9)
+        self.assertEqual(a.GetBalanceAt(tomorrow), 11.5)
+        self.assertEqual([a.GetRunningTotal(t) for t in (t1, t3, t2)], [10, 9, 11.5])
+
+        # The index follows additions, removals, and amount and date changes.
+        t4 = a.AddTransaction(100, date=tomorrow)
+        t2.Amount = 3
+        t1.Date = tomorrow
+        self.assertEqual([a.GetRunningTotal(t) for t in (t3, t2, t1, t4)], [-1, 2, 12, 112])
+        self.assertEqual(a.GetCurrentBalance(), 2)
+        a.RemoveTransaction(t3)
+        self.assertEqual(a.GetBalanceAt(today), 3)
+
+        # Including dates far outside the ones it was built for, and moves between accounts.
+        t5 = a.AddTransaction(1, date=datetime.date(1990, 1, 1))
+        t4.Date = datetime.date(2100, 1, 1)
+        self.assertEqual(a.GetBalanceAt(datetime.date(1990, 1, 1)), 1)
+        self.assertEqual(a.GetBalanceAt(tomorrow), 14)
+        self.assertEqual(a.GetRunningTotal(t4), 114)
+        a.MoveTransactions([t4], b)
+        self.assertEqual(a.GetBalanceAt(datetime.date(2100, 1, 1)), 14)
+        self.assertEqual(b.GetBalanceAt(datetime.date(2100, 1, 1)), 100)
+
+    def testQuery(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        t1 = a.AddTransaction(100, description="#rent", date=datetime.date(2010, 3, 1))
+        t2 = a.AddTransaction(-20, date=datetime.date(2010, 3, 15))
+        t3 = a.AddTransaction(500, description="#rent", date=datetime.date(2010, 4, 1))
+        t4 = b.AddTransaction(250, date=datetime.date(2010, 3, 31))
+
+        self.assertEqual(model.Query(amountRange=(100, 500)), [t1, t4, t3])
+        self.assertEqual(model.Query(amountRange=(None, 0)), [t2])
+        self.assertEqual(model.Query(dateRange=(datetime.date(2010, 3, 15), None)), [t2, t4, t3])
+        self.assertEqual(model.Query([a], amountRange=(0, None), dateRange=(None, datetime.date(2010, 3, 31))), [t1])
+        self.assertEqual(model.Query(tags=[Tag("rent")], amountRange=(200, None)), [t3])
+
+        # The indexes follow edits.
+        t2.Amount = 300
+        t1.Date = datetime.date(2010, 5, 1)
+        self.assertEqual(model.Query([a], amountRange=(200, 400)), [t2])
+        self.assertEqual(model.Query([a], dateRange=(datetime.date(2010, 4, 1), None)), [t3, t1])
+        a.RemoveTransaction(t3)
+        self.assertEqual(model.Query([a], dateRange=(datetime.date(2010, 4, 1), None)), [t1])
+        # Results are in (Date, ID) order, like every other list of transactions.
+        t5 = b.AddTransaction(1, date=datetime.date(2010, 5, 1))
+        self.assertEqual(model.Query([b, a], dateRange=(datetime.date(2010, 4, 1), None)), [t1, t5])
+
+    def testRangeSearch(self):
+        model = self.Controller.Model
+        a = model.CreateAccount("A")
+        t1 = a.AddTransaction(100, date=datetime.date(2010, 3, 1))
+        t2 = a.AddTransaction(-20, date=datetime.date(2010, 3, 31))
+        t3 = a.AddTransaction(500, date=datetime.date(2011, 1, 1))
+
+        self.assertEqual(model.Search("100..500", matchIndex=0), [t1, t3])
+        self.assertEqual(model.Search("..0", matchIndex=0), [t2])
+        self.assertEqual(model.Search("2010-03", matchIndex=2), [t1, t2])
+        self.assertEqual(model.Search("2010/03/31", matchIndex=2), [t2])
+        self.assertEqual(model.Search("2010-03-15..2011", matchIndex=2), [t2, t3])
+        self.assertEqual(model.Search("2011", matchIndex=2), [t3])
+        # Anything else is still a regular expression.
+        self.assertEqual(model.Search("2010-03-3", matchIndex=2), [t2])
+        self.assertEqual(model.Search("^-", matchIndex=0), [t2])
+
+        # The search options give the bounds separately.
+        self.assertEqual(model.ParseBounds("", " 1.5", 0), (None, 1.5))
+        self.assertEqual(model.ParseBounds("2010-03", "2010", 2), (datetime.date(2010, 3, 1), datetime.date(2010, 12, 31)))
+        self.assertRaises(ValueError, model.ParseBounds, "2010-0", "", 2)
         
     def testAccountsAreSorted(self):
         model = self.Controller.Model
@@ -536,6 +854,48 @@ class ModelTests(testbase.TestCaseWithController):
         self.assertEqual(a.Balance, 2)
         self.assertEqual(a.CurrentBalance, 1)
         
+    def testAddTransactionsInBulk(self):
+        model = self.Model
+        a = model.CreateAccount("A")
+        existing = a.AddTransaction(1)
+
+        created = []
+        # Keep a reference, as pubsub only holds listeners weakly.
+        listener = lambda message: created.append(message.data)
+        Publisher.subscribe(listener, "transactions.created")
+
+        transactions = [Transaction(None, None, i, "bulk %i" % i, today) for i in range(1, 4)]
+        a.AddTransactions(transactions)
+        Publisher.unsubscribe(listener)
+
+        self.assertEqual(created, [(a, transactions)])
+        self.assertEqual(a.Transactions, [existing] + transactions)
+        self.assertEqual(len(set(t.ID for t in a.Transactions)), 4)
+        self.assertEqual(a.Balance, 7)
+
+        model2 = model.Store.GetModel(useCached=False)
+        self.assertEqual(model, model2)
+
+    def testAddTransactionsInBulkWithSources(self):
+        model = self.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        c = model.CreateAccount("C")
+
+        transactions = [Transaction(None, None, i, "bulk %i" % i, today) for i in range(1, 4)]
+        a.AddTransactions(transactions, [b, None, c])
+
+        t1, t2, t3 = a.Transactions
+        self.assertEqual(t1.LinkedTransaction, b.Transactions[0])
+        self.assertEqual(b.Transactions[0].LinkedTransaction, t1)
+        self.assertEqual(t2.LinkedTransaction, None)
+        self.assertEqual(t3.LinkedTransaction, c.Transactions[0])
+        self.assertEqual((a.Balance, b.Balance, c.Balance), (6, -1, -3))
+        self.assertEqual(c.Transactions[0].Description, "Transfer to A (bulk 3)")
+
+        model2 = model.Store.GetModel(useCached=False)
+        self.assertEqual(model, model2)
+
     def testAccountBalanceAndCurrencyNotNone(self):
         model = self.Model
         accounts = [
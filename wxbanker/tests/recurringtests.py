@@ -20,6 +20,7 @@
 
 from wxbanker.tests import testbase
 import unittest, datetime
+from wx.lib.pubsub import Publisher
 
 from bankobjects.recurringtransaction import RecurringTransaction
 from testbase import today, yesterday, tomorrow, one
@@ -63,6 +64,27 @@ class RecurringTest(testbase.TestCaseWithController):
         self.assertEqual(len(account.Transactions), 1)
         self.assertEqual(account.Transactions[0].RecurringParent, None)
         
+    def testPerformingSendsOneMessagePerAccount(self):
+        model, account = self.createAccount()
+        other = model.CreateAccount("B")
+        start = today - datetime.timedelta(days=4)
+        rt = account.AddRecurringTransaction(1, "test", start, RecurringTransaction.DAILY, source=other)
+
+        messages = []
+        listener = lambda message: messages.append((message.topic, message.data[0]))
+        Publisher.subscribe(listener, "transaction.created")
+        Publisher.subscribe(listener, "transactions.created")
+        rt.PerformTransactions()
+        Publisher.unsubscribe(listener)
+
+        self.assertEqual(sorted(messages), sorted([(("transactions", "created"), account), (("transactions", "created"), other)]))
+        self.assertEqual(len(account.Transactions), 5)
+        self.assertEqual(len(other.Transactions), 5)
+        for t in account.Transactions + other.Transactions:
+            self.assertEqual(t.RecurringParent, rt)
+        self.assertEqual(account.Balance, 5)
+        self.assertEqual(other.Balance, -5)
+
     def testRecurringDefaults(self):
         model, account = self.createAccount()
         rt = account.AddRecurringTransaction(1, "test", today, RecurringTransaction.DAILY)
@@ -19,6 +19,10 @@
 #    along with wxBanker.  If not, see <http://www.gnu.org/licenses/>.
 
 from wxbanker.tests import testbase
+import sqlite3, datetime
+from wxbanker.currencies import amount2units
+from wx.lib.pubsub import Publisher
+from wxbanker.bankobjects import transaction
 
 class StoreTests(testbase.TestCaseWithController):
     def testRemovingAccountRemovesTransactions(self):
@@ -40,5 +44,216 @@ class StoreTests(testbase.TestCaseWithController):
         
         self.assertEqual(howmany("SELECT * FROM accounts"), 0)
         self.assertEqual(howmany("SELECT * FROM transactions"), 0)
-        
-        
\ No newline at end of file
+
+    def testRemoveTransactionsInChunks(self):
+        model = self.Model
+        store = model.Store
+        store.SQL_VARIABLE_LIMIT = 2
+
+        foo = model.CreateAccount("Foo")
+        transactions = [foo.AddTransaction(i) for i in range(5)]
+        foo.RemoveTransactions(transactions[:4])
+
+        rows = store.dbconn.cursor().execute("SELECT id FROM transactions").fetchall()
+        self.assertEqual(rows, [(transactions[4].ID,)])
+        self.assertEqual(foo.Transactions, [transactions[4]])
+        self.assertEqual(foo.Balance, 4)
+
+    def testPurgeUnlinksTransfers(self):
+        model = self.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        atrans, btrans = a.AddTransaction(1, source=b)
+
+        a.Purge()
+
+        self.assertEqual(b.Transactions, [btrans])
+        self.assertEqual(btrans.LinkedTransaction, None)
+        linkId = model.Store.dbconn.cursor().execute("SELECT linkId FROM transactions WHERE id=?", (btrans.ID,)).fetchone()[0]
+        self.assertEqual(linkId, None)
+
+    def testSyncBalancesDoesNotLoadTransactions(self):
+        model = self.Model
+        a = model.CreateAccount("A")
+        b = model.CreateAccount("B")
+        a.AddTransaction(5)
+        b.AddTransaction(-2)
+        model.Store.dbconn.cursor().execute("UPDATE accounts SET balance=0")
+
+        model2 = model.Store.GetModel(useCached=False)
+        self.assertEqual([acc.Balance for acc in model2.Accounts], [0, 0])
+
+        model.Store.syncBalances()
+        self.assertEqual([acc.Balance for acc in model2.Accounts], [5, -2])
+        self.assertEqual([acc._Transactions for acc in model2.Accounts], [None, None])
+        rows = model.Store.dbconn.cursor().execute("SELECT balance FROM accounts ORDER BY name").fetchall()
+        self.assertEqual(rows, [(amount2units(5),), (amount2units(-2),)])
+
+    def testAmountsAreStoredAsUnits(self):
+        model = self.Model
+        a = model.CreateAccount("A")
+        for i in range(10):
+            a.AddTransaction(.1)
+
+        # Ten floats of .1 don't add up to 1.0, but the units do.
+        self.assertEqual(a.Balance, 1.0)
+        rows = model.Store.dbconn.cursor().execute("SELECT amount FROM transactions").fetchall()
+        self.assertEqual(rows, [(100,)] * 10)
+        self.assertEqual(model.Store.GetTransactionSum(a), 1.0)
+
+        model2 = model.Store.GetModel(useCached=False)
+        self.assertEqual(model2.Accounts[0].Balance, 1.0)
+        self.assertEqual(model2.Accounts[0].Transactions[0].Amount, .1)
+
+    def testDatesAreStoredAsOrdinals(self):
+        model = self.Model
+        a = model.CreateAccount("A")
+        t = a.AddTransaction(1, date="2010/03/04")
+        t.Date = "2010/03/05"
+
+        date = model.Store.dbconn.cursor().execute("SELECT date FROM transactions WHERE id=?", (t.ID,)).fetchone()[0]
+        self.assertEqual(date, datetime.date(2010, 3, 5).toordinal())
+
+        model2 = model.Store.GetModel(useCached=False)
+        self.assertEqual(model2.Accounts[0].Transactions[0].Date, datetime.date(2010, 3, 5))
+
+    def testTransactionSumBetweenDates(self):
+        store = self.Model.Store
+        a = self.Model.CreateAccount("A")
+        for day in range(1, 6):
+            a.AddTransaction(day, date=datetime.date(2010, 1, day))
+
+        self.assertEqual(store.GetTransactionSum(a), 15)
+        self.assertEqual(store.GetTransactionSum(a, startDate=datetime.date(2010, 1, 2), endDate=datetime.date(2010, 1, 4)), 9)
+        self.assertEqual(store.GetTransactionSum(a, startDate=datetime.date(2010, 1, 6)), 0)
+
+    def testUpdatesAreCoalescedUntilBatchEnds(self):
+        store = self.Model.Store
+        a = self.Model.CreateAccount("A")
+        t = a.AddTransaction(1)
+        # Load it first, as loading is a statement which would apply the queue.
+        a.Transactions
+
+        def storedAmount():
+            return store.dbconn.cursor().execute("SELECT amount FROM transactions WHERE id=?", (t.ID,)).fetchone()[0]
+
+        Publisher.sendMessage("batch.start")
+        for amount in range(2, 7):
+            t.Amount = amount
+        # The transaction is queued once with its amount dirty, as is the account's balance.
+        self.assertEqual(store.dirtyObjects, [t, a])
+        self.assertEqual(a.DirtyFields, a.ORM_BITS["Balance"])
+        self.assertEqual(t.DirtyFields, t.ORM_BITS["_Amount"])
+        self.assertEqual(storedAmount(), amount2units(1))
+        Publisher.sendMessage("batch.end")
+
+        self.assertEqual(store.dirtyObjects, [])
+        self.assertEqual(t.DirtyFields, 0)
+        self.assertEqual(storedAmount(), amount2units(6))
+
+    def testQueuedUpdatesAreSeenByStatements(self):
+        store = self.Model.Store
+        a = self.Model.CreateAccount("A")
+        t = a.AddTransaction(1)
+        store.AutoSave = False
+
+        t.Amount = 3
+        self.assertEqual(store.dirtyObjects, [t, a])
+        self.assertEqual(store.GetTransactionSum(a), 3)
+        self.assertEqual(store.dirtyObjects, [])
+
+    def testDirtyFieldsAreWrittenTogether(self):
+        store = self.Model.Store
+        a = self.Model.CreateAccount("A")
+        t = a.AddTransaction(1, "before")
+        rt = a.AddRecurringTransaction(1, "test", datetime.date.today(), 0)
+
+        Publisher.sendMessage("batch.start")
+        t.Description = "after #tagged"
+        t.Amount = 2
+        rt.Amount = 3
+        # Setting Amount sets Transaction._Amount, which isn't a field of recurring transactions.
+        self.assertEqual(rt.DirtyFields, rt.ORM_BITS["Amount"])
+        Publisher.sendMessage("batch.end")
+
+        cursor = store.dbconn.cursor()
+        self.assertEqual(cursor.execute("SELECT description, amount FROM transactions WHERE id=?", (t.ID,)).fetchone(), ("after #tagged", amount2units(2)))
+        self.assertEqual(cursor.execute("SELECT amount FROM recurring_transactions WHERE id=?", (rt.ID,)).fetchone()[0], 3)
+        self.assertEqual(store.GetTagCounts(), {"tagged": 1})
+
+    def assertQueryUsesIndex(self, query, index):
+        plan = self.Model.Store.dbconn.cursor().execute("EXPLAIN QUERY PLAN " + query, (1, 2, 3)[:query.count("?")]).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        self.assertTrue(index in details, "%s not used in: %s" % (index, details))
+
+    def testQueriesUseIndexes(self):
+        self.assertQueryUsesIndex("SELECT * FROM transactions WHERE accountId=?", "transactions_accountId_date_idx")
+        self.assertQueryUsesIndex("SELECT * FROM transactions WHERE accountId=? AND date BETWEEN ? AND ?", "transactions_accountId_date_idx")
+        self.assertQueryUsesIndex("SELECT * FROM transactions WHERE linkId=?", "transactions_linkId_idx")
+        self.assertQueryUsesIndex("SELECT * FROM transactions WHERE recurringParent=?", "transactions_recurringParent_idx")
+
+class StoreDiskTests(testbase.TestCaseWithControllerOnDisk):
+    def committedCount(self, table):
+        # A separate connection only sees what has actually been committed.
+        conn = sqlite3.connect(self.DBFILE)
+        count = conn.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+        conn.close()
+        return count
+
+    def testStoreUsesWriteAheadLog(self):
+        mode = self.Model.Store.dbconn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def testGroupCommitWaitsForWindow(self):
+        store = self.Model.Store
+        store.GroupCommit = True
+        store.COMMIT_WINDOW = 60
+
+        a = self.Model.CreateAccount("A")
+        self.assertEqual(self.committedCount("accounts"), 0)
+        self.assertEqual(store.PendingWrites, 1)
+
+        store.FlushPendingCommits()
+        self.assertEqual(self.committedCount("accounts"), 1)
+        self.assertEqual(store.PendingWrites, 0)
+
+    def testGroupCommitCommitsWhenFull(self):
+        store = self.Model.Store
+        store.GroupCommit = True
+        store.COMMIT_WINDOW = 60
+        store.COMMIT_MAX_PENDING = 3
+
+        self.Model.CreateAccount("A")
+        self.Model.CreateAccount("B")
+        self.assertEqual(self.committedCount("accounts"), 0)
+        self.Model.CreateAccount("C")
+        self.assertEqual(self.committedCount("accounts"), 3)
+
+    def testGroupCommitFlushesOnExit(self):
+        store = self.Model.Store
+        store.GroupCommit = True
+        store.COMMIT_WINDOW = 60
+
+        a = self.Model.CreateAccount("A")
+        a.AddTransaction(1)
+        self.assertEqual(self.committedCount("transactions"), 0)
+
+        Publisher.sendMessage("exiting")
+        self.assertEqual(self.committedCount("transactions"), 1)
+        self.assertFalse(store.Dirty)
+
+    def testInternCachesAreClearedOnReloadAndClose(self):
+        a = self.Model.CreateAccount("A")
+        a.AddTransaction(1, "Groceries")
+        self.assertTrue(transaction.descriptionCache)
+        self.assertTrue(transaction.dateCache)
+
+        self.Model.Store.GetModel(useCached=False)
+        self.assertEqual(transaction.descriptionCache, {})
+        self.assertEqual(transaction.dateCache, {})
+
+        a.AddTransaction(2, "Rent")
+        self.assertTrue(transaction.descriptionCache)
+        self.Controller.Close()
+        self.assertEqual(transaction.descriptionCache, {})
+        self.assertEqual(transaction.dateCache, {})
@@ -20,7 +20,7 @@
 
 from wxbanker.tests import testbase
 from wxbanker import bankobjects
-import unittest, datetime
+import unittest, datetime, sys
 from wxbanker.tests.testbase import today, yesterday, one
 from wxbanker.plots.baseplot import BasePlot
 
@@ -102,6 +102,37 @@ class SummaryTests(testbase.TestCaseWithController):
         amounts, start, delta = self.get([(today-one*2, 3), (today-one, 2), (today, 1)], 2, None, (today-one*2, today-one))
         # Make sure 'today' isn't counted as it isn't in our date range.
         self.assertEqual(amounts, [3.0, 5.0])
-        
+
+    def testVectorizedTotalsMatchDailyTotals(self):
+        for account in self.Model.Accounts:
+            self.Model.RemoveAccount(account.Name)
+        a = self.Model.CreateAccount("A")
+        b = self.Model.CreateAccount("B")
+        b.Currency = 1
+        for i in range(60):
+            a.AddTransaction(amount=(i * 37 % 200 - 100) / 3.0, date=today - one * (i * 7 % 45))
+            b.AddTransaction(amount=(i * 13 % 90 - 40) * 1.005, date=today - one * (i * 11 % 50))
+        self.Model.GlobalCurrency = 2
+
+        accounts = list(self.Model.Accounts)
+        for currency, daterange in ((2, None), (1, None), (0, (today - one * 20, today + one * 3)), (2, (today + one, today + one * 4))):
+            self.assertEqual(
+                self.Model.getXTotalsVectorized(accounts, currency, daterange),
+                self.Model.getXTotalsByDay(accounts, currency, daterange),
+            )
+        self.assertEqual(self.Model.GetXTotals(b), self.Model.getXTotalsByDay([b], 1, None))
+
+        # Without NumPy, the totals are walked a day at a time instead.
+        numpy = sys.modules.get("numpy")
+        sys.modules["numpy"] = None
+        try:
+            self.assertEqual(self.Model.GetXTotals(b), self.Model.getXTotalsByDay([b], 1, None))
+            self.assertRaises(ImportError, self.Model.getXTotalsVectorized, [b], 1, None)
+        finally:
+            if numpy is None:
+                del sys.modules["numpy"]
+            else:
+                sys.modules["numpy"] = numpy
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -133,7 +133,35 @@ class TagTests(testbase.TestCaseWithController):
         self.assertEqual(t.Tags, set([Tag("bar")]))
         self.assertEqual(t2.Tags, set())
         self.assertEqual(model.Tags, set([Tag("bar")]))
-        
+
+    def testTagsAreLoadedFromIndex(self):
+        model = self.Model
+        a = model.CreateAccount("A")
+        t = a.AddTransaction(amount=1, description="testing #foo #bar")
+        t.Description = "testing #foo #baz"
+
+        model2 = model.Store.GetModel(useCached=False)
+        # The model knows the tags before any transactions are loaded.
+        self.assertEqual(model2.Accounts[0]._Transactions, None)
+        self.assertEqual(model2.Tags, set([Tag("foo"), Tag("baz")]))
+        self.assertEqual(model2.Accounts[0].Transactions[0].Tags, set([Tag("foo"), Tag("baz")]))
+
+        a.RemoveTransaction(t)
+        self.assertEqual(model.Tags, set())
+
+    def testSearchByTag(self):
+        model = self.Model
+        a = model.CreateAccount("A")
+        t1 = a.AddTransaction(amount=1, description="testing #foo")
+        t2 = a.AddTransaction(amount=1, description="testing #foobar")
+        t3 = a.AddTransaction(amount=1, description="testing #f_o")
+        self.assertEqual(model.Search("#foo"), [t1, t2])
+        self.assertEqual(model.Search("#FOOBAR"), [t2])
+        # A partly typed tag matches the tags it starts, and wildcards aren't special.
+        self.assertEqual(model.Search("#fo"), [t1, t2])
+        self.assertEqual(model.Search("#f_"), [t3])
+        self.assertEqual(model.Search("#bar"), [])
+
         
 
 if __name__ == "__main__":
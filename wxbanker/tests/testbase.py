@@ -53,6 +53,12 @@ import wxbanker
 from wxbanker import controller, fileservice
 from wx.lib.pubsub import Publisher
 
+def removeDb(path):
+    """Remove a database file along with the -wal and -shm files SQLite keeps next to it in WAL mode."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
 def fixturefile(name):
     return fileservice.getSharedFilePath("fixtures", name)
 
@@ -134,8 +140,7 @@ class TestCaseWithControllerOnDisk(TestCaseWithController):
     DBFILE = "test.db"
     
     def removeTestDbIfExists(self):
-        if os.path.exists(self.DBFILE):
-            os.remove(self.DBFILE)
+        removeDb(self.DBFILE)
     
     def setUp(self):
         self.removeTestDbIfExists()
@@ -33,8 +33,9 @@ import wx, datetime
 from wx.lib.pubsub import Publisher
 from wxbanker.ObjectListView import GroupListView, ColumnDefn, CellEditorRegistry
 from wxbanker import bankcontrols, tagtransactiondialog
+from wxbanker.bankobjects.searchsession import SearchSession
 
-from wxbanker.currencies import GetCurrencyInt
+from wxbanker.currencies import GetCurrencyInt, amount2units, units2amount
 
 class TransactionOLV(GroupListView):
     EMPTY_MSG_NORMAL = _("No transactions entered.")
@@ -43,6 +44,7 @@ class TransactionOLV(GroupListView):
     def __init__(self, parent, bankController):
         GroupListView.__init__(self, parent, style=wx.LC_REPORT|wx.SUNKEN_BORDER, name="TransactionOLV")
         self.LastSearch = None
+        self.SearchSession = None
         self.CurrentAccount = None
         self.BankController = bankController
 
@@ -81,9 +83,11 @@ class TransactionOLV(GroupListView):
 
         self.Subscriptions = (
             (self.onSearch, "SEARCH.INITIATED"),
+            (self.onSearch, "SEARCH.QUERY"),
             (self.onSearchCancelled, "SEARCH.CANCELLED"),
             (self.onSearchMoreToggled, "SEARCH.MORETOGGLED"),
             (self.onTransactionAdded, "transaction.created"),
+            (self.onTransactionsAdded, "transactions.created"),
             (self.onTransactionsRemoved, "transactions.removed"),
             (self.onCurrencyChanged, "currency_changed"),
             (self.onShowCurrencyNickToggled, "controller.show_currency_nick_toggled"),
@@ -137,15 +141,23 @@ class TransactionOLV(GroupListView):
         self.SortBy(self.SORT_COL)
         self.Thaw()
 
+    def usesBalanceIndex(self):
+        # A whole account's balances come from its BalanceIndex, but search results have their own.
+        return self.CurrentAccount is not None and not self.IsSearchActive()
+
     def getTotal(self, transObj):
+        if self.usesBalanceIndex():
+            return self.CurrentAccount.GetRunningTotal(transObj)
+
         if not hasattr(transObj, "_Total"):
             self.updateTotals()
         
         return transObj._Total
     
-    def updateTotals(self, message=None):
+    def updateTotals(self, message=None, start=0):
+        """Set the running totals of the rows, from the given row on as those before it are unchanged."""
         first = self.GetObjectAt(0)
-        if first is None:
+        if first is None or self.usesBalanceIndex():
             return
         
         if not self.CurrentAccount:
@@ -157,13 +169,31 @@ class TransactionOLV(GroupListView):
             # balance currency = accounts currency
             balance_currency = GetCurrencyInt(self.CurrentAccount.GetCurrency())
         
-        first._Total = first.GetAmount(balance_currency)
-        
-        b = first
-        for i in range(1, len(self.GetObjects())):
-            a, b = b, self.GetObjectAt(i)
-            b._Total = a._Total + b.GetAmount(balance_currency)
+        # Keep the running total in integer units so it doesn't drift over a long history.
+        total = 0
+        if start > 0:
+            previous = self.GetObjectAt(start - 1)
+            if hasattr(previous, "_Total"):
+                total = amount2units(previous._Total)
+            else:
+                start = 0
+        for i in range(start, len(self.GetObjects())):
+            b = self.GetObjectAt(i)
+            total += amount2units(b.GetAmount(balance_currency))
+            b._Total = units2amount(total)
     
+    def getFirstIndexOf(self, transactions):
+        """Return the first row of any of the transactions, searching from the end where new ones usually are."""
+        remaining = set(id(t) for t in transactions)
+        first = len(self.innerList)
+        for i in range(len(self.innerList) - 1, -1, -1):
+            if id(self.innerList[i]) in remaining:
+                remaining.remove(id(self.innerList[i]))
+                first = i
+                if not remaining:
+                    break
+        return first
+
     def renderDateIDTuple(self, pair):
         return str(pair[0])
   
@@ -201,14 +231,11 @@ class TransactionOLV(GroupListView):
         if len(transactions) == 0:
             return
 
-        for i, attr in enumerate(("Amount", "_Total")):
-            # Sort by amount, then compare the highest and lowest, to take into account a negative sign.
-            sortedtrans = list(sorted(transactions, cmp=lambda a,b: cmp(getattr(a, attr), getattr(b, attr))))
-            high, low = sortedtrans[0], sortedtrans[-1]
-            # Get the (translated) displayed column name to calculate width.
-            header = _({"_Total": "Balance"}.get(attr, attr))
+        for i, (header, getter) in enumerate(((_("Amount"), lambda t: t.Amount), (_("Balance"), self.getTotal))):
+            # Compare the highest and lowest, to take into account a negative sign.
+            low, high = min(transactions, key=getter), max(transactions, key=getter)
             # Take the max of the two as well as the column header width, as we need to at least display that.
-            widestWidth = max([self.GetTextExtent(header)[0]] + [self.GetTextExtent(self.renderFloat(getattr(t, attr)))[0] for t in (high, low)])
+            widestWidth = max([self.GetTextExtent(header)[0]] + [self.GetTextExtent(self.renderFloat(getter(t)))[0] for t in (high, low)])
             wx.CallAfter(self.SetColumnFixedWidth, *(self.COL_AMOUNT+i, widestWidth + 10))
 
     def sizeAmounts(self):
@@ -264,7 +291,7 @@ class TransactionOLV(GroupListView):
             # If the right-click was on the total column, use the total, otherwise the amount.
             if col == self.COL_TOTAL:
                 # Use the last total if multiple are selected.
-                amount = transactions[-1]._Total
+                amount = self.getTotal(transactions[-1])
             else:
                 amount = sum((t.Amount for t in transactions))
                 
@@ -364,7 +391,7 @@ class TransactionOLV(GroupListView):
         """
         if col == self.COL_TOTAL:
             # Use the last total if multiple are selected.
-            amount = transactions[-1]._Total
+            amount = self.getTotal(transactions[-1])
         else:
             amount = sum((t.Amount for t in transactions))
 
@@ -379,8 +406,18 @@ class TransactionOLV(GroupListView):
             self.CurrentAccount.RemoveTransactions(transactions)
         # We won't have a CurrentAccount when viewing all accounts (LP: #620924)
         else:
+            # Remove them in one go per account.
+            accounts, transactionsByAccount = [], {}
             for transaction in transactions:
-                transaction.Parent.RemoveTransaction(transaction)
+                if transaction.Parent.ID not in transactionsByAccount:
+                    accounts.append(transaction.Parent)
+                    transactionsByAccount[transaction.Parent.ID] = []
+                transactionsByAccount[transaction.Parent.ID].append(transaction)
+            for account in accounts:
+                # A transfer removed with an earlier account may have taken this one with it.
+                remaining = [t for t in transactionsByAccount[account.ID] if t.Parent is account]
+                if remaining:
+                    account.RemoveTransactions(remaining)
 
     def onMoveTransactions(self, transactions, targetAccount):
         """Move the transactions to the target account."""
@@ -402,10 +439,18 @@ class TransactionOLV(GroupListView):
         account, transaction = message.data
         if account is self.CurrentAccount:
             self.AddObject(transaction)
-            self.updateTotals()
+            self.updateTotals(start=self.getFirstIndexOf([transaction]))
             self.Reveal(transaction)
             self.sizeAmounts()
 
+    def onTransactionsAdded(self, message):
+        account, transactions = message.data
+        if account is self.CurrentAccount:
+            self.AddObjects(transactions)
+            # Only the totals from the first new row on change.
+            self.updateTotals(start=self.getFirstIndexOf(transactions))
+            self.sizeAmounts()
+
     def onTagSearch(self, tag):
         Publisher.sendMessage("SEARCH.EXTERNAL", str(tag))
         
@@ -427,17 +472,41 @@ class TransactionOLV(GroupListView):
         self.doSearch(self.LastSearch)
         
     def doSearch(self, searchData):
-        searchString, match = searchData
+        # Structured queries from the search options come as a dict of BankModel.Query arguments.
+        if isinstance(searchData, dict):
+            return self.doQuery(searchData)
+        # The regex flag is optional, for searches which don't come from the SearchCtrl.
+        searchString, match = searchData[:2]
+        regex = len(searchData) > 2 and searchData[2]
         account = self.CurrentAccount
-        matches = self.BankController.Model.Search(searchString, account=account, matchIndex=match)
-        self.SetObjects(matches)
+        # Searching through a session lets each keystroke refine the previous matches.
+        model = self.BankController.Model
+        if self.SearchSession is None or self.SearchSession.Model is not model:
+            self.SearchSession = SearchSession(model)
         self.SetSearchActive(True)
+        # Big searches finish on a worker, and only the latest one's matches are shown.
+        self.SearchSession.SearchInBackground(self.onSearchResults, searchString, account=account, matchIndex=match, regex=regex)
+
+    def doQuery(self, query):
+        accounts = None
+        if self.CurrentAccount is not None and not query["allAccounts"]:
+            accounts = [self.CurrentAccount]
+        self.SetSearchActive(True)
+        # Don't let a text search still on a worker replace these.
+        if self.SearchSession is not None:
+            self.SearchSession.Cancel()
+        self.SetObjects(self.BankController.Model.Query(accounts, query["amountRange"], query["dateRange"], query["tags"]))
+
+    def onSearchResults(self, matches):
+        self.SetObjects(matches)
 
     def onSearchCancelled(self, message):
         # Ignore cancels on an inactive search to avoid silly refreshes.
         if self.IsSearchActive():
             self.SetSearchActive(False)
             self.setAccount(self.CurrentAccount)
+        if self.SearchSession is not None:
+            self.SearchSession.Cancel()
         self.SetEmptyListMsg(self.EMPTY_MSG_NORMAL)
 
     def onSearchMoreToggled(self, message):